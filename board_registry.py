@@ -0,0 +1,54 @@
+from collections import defaultdict
+
+import discord
+
+from outbound import BOARD
+
+
+class BoardRegistry:
+    # Message IDs of the boards the bot keeps editing in place, keyed by
+    # (purpose, GameModeID, channel_id) with one ID per message of the board.
+    # Loaded once on startup; every change is written through to the
+    # board_messages table. Boards not tied to a mode use GameModeID 0.
+    def __init__(self, db, outbound):
+        self.db = db
+        self.outbound = outbound
+        self._boards = {}
+
+    async def load(self):
+        boards = defaultdict(list)
+        for purpose, GameModeID, channel_id, message_id in await self.db.get_board_messages():
+            boards[(purpose, GameModeID, channel_id)].append(message_id)
+        self._boards = dict(boards)
+
+    def get(self, purpose, channel_id, GameModeID=0):
+        return list(self._boards.get((purpose, GameModeID, channel_id), ()))
+
+    async def set(self, purpose, channel_id, message_ids, GameModeID=0):
+        message_ids = list(message_ids)
+        if self._boards.get((purpose, GameModeID, channel_id), []) == message_ids:
+            return
+        await self.db.set_board_messages(purpose, GameModeID, channel_id, message_ids)
+        self._boards[(purpose, GameModeID, channel_id)] = message_ids
+
+    async def resync(self):
+        # Rewrites the table from memory, which knows the messages currently
+        # in use, e.g. after a restore brought back older IDs.
+        await self.db.replace_board_messages([
+            (purpose, GameModeID, channel_id, position, message_id)
+            for (purpose, GameModeID, channel_id), message_ids in self._boards.items()
+            for position, message_id in enumerate(message_ids)
+        ])
+
+    async def edit_or_send(self, channel, purpose, GameModeID=0, **fields):
+        # Single-message boards: edits the registered message without fetching
+        # it first, and only sends a new one if it is missing.
+        message_ids = self.get(purpose, channel.id, GameModeID)
+        if message_ids:
+            try:
+                return await self.outbound.edit(channel.get_partial_message(message_ids[0]), **fields)
+            except discord.NotFound:
+                pass
+        message = await self.outbound.send(channel, priority=BOARD, **fields)
+        await self.set(purpose, channel.id, [message.id], GameModeID)
+        return message
@@ -1,10 +1,25 @@
 import discord
 from discord.ext import commands
 import asyncio
+import functools
 import os
+from datetime import timedelta
+from board_registry import BoardRegistry
+from database import Database
+from match_queue import MatchQueue
+from name_directory import NameDirectory
+from outbound import INTERACTIVE, Outbound
 from utils import config
 from utils.errors import CustomError
 
+class LadderContext(commands.Context):
+    # Command replies go through the outbound scheduler ahead of all
+    # background traffic.
+    async def send(self, *args, **kwargs):
+        return await self.bot.outbound.submit(INTERACTIVE, ("send", self.channel.id),
+                                              functools.partial(super().send, *args, **kwargs))
+
+
 class TWWLadderBot(commands.Bot):
     def __init__(self):
         intents = discord.Intents.default()
@@ -12,13 +27,46 @@ class TWWLadderBot(commands.Bot):
         intents.members = True
         super().__init__(command_prefix="!", intents=intents)
         self.config = config
+        self.db = Database()
+        self.outbound = Outbound()
+        self.names = NameDirectory(self.db)
+        self.boards = BoardRegistry(self.db, self.outbound)
+        self.queue = MatchQueue(
+            self.db,
+            on_change=lambda GameModeID: self.dispatch("queue_changed", GameModeID),
+            timeout=timedelta(minutes=config.QUEUE_TIMEOUT_MINUTES),
+            on_expire=lambda discord_id, GameModeID: self.dispatch("queue_expired", discord_id, GameModeID),
+            on_match=lambda GameModeID, player1, player2: self.dispatch("queue_matched", GameModeID, player1, player2),
+        )
 
     async def setup_hook(self):
+        await self.names.load()
+        await self.boards.load()
+        await self.queue.load()
         cogs_folder = "cogs"
         for filename in os.listdir(cogs_folder):
             if filename.endswith(".py"):
                 await self.load_extension(f'{cogs_folder}.{filename[:-3]}')
         print("Cogs loaded.")
+        self.queue.start(ready=self.wait_until_ready)
+
+    async def resync_state(self):
+        # After a database restore the in-memory queue, names and boards
+        # still reflect what is live on Discord; they are written back over
+        # the snapshot's rows.
+        await self.queue.resync()
+        await self.names.resync()
+        await self.boards.resync()
+
+    async def get_context(self, origin, *, cls=LadderContext):
+        return await super().get_context(origin, cls=cls)
+
+    async def close(self):
+        await super().close()
+        await self.outbound.close()
+        await self.queue.close()
+        await self.names.close()
+        await self.db.close()
 
     async def on_command_error(self, ctx, error):
         if isinstance(error, CustomError):
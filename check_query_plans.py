@@ -0,0 +1,39 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+from database import Database
+
+
+async def seed(db):
+    for discord_id in (1, 2, 3):
+        await db.add_player(discord_id)
+        await db.add_player_mode(discord_id, 1)
+    await db.add_to_queue(3, 1)
+    await db.finish_match(await db.create_match(1, 2, 1, None, []), 1, 2, 1, 1000, 1016, 1000, 984)
+    match_id = await db.create_match(1, 2, 1, None, [])
+    await db.place_bet(3, match_id, 1, 10)
+    return match_id
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "ladder.db"))
+        try:
+            match_id = await seed(db)
+            scans = await db.check_query_plans(1, 1, match_id)
+        finally:
+            await db.close()
+
+    for statement, details in scans:
+        print(f"{'; '.join(details)}\n    {statement}")
+    if scans:
+        print(f"{len(scans)} hot queries still scan a table.")
+        return 1
+    print("All hot queries use an index.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,32 +1,55 @@
 import discord
-from discord.ext import commands
-from database import Database
-from logic import update_elo
+from discord.ext import commands, tasks
 import re
+from datetime import datetime, timedelta
 
-from utils.maps import MODE_MAP
+from utils.maps import MODE_MAP, REVERSE_MODE_MAP
+from utils.users import resolve_users
 
 
 class Admin(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
         self.mode_map = MODE_MAP
+        self.archive_old_rows.start()
+        self.backup_database.start()
 
-    
+    def cog_unload(self):
+        self.archive_old_rows.cancel()
+        self.backup_database.cancel()
+
+    @tasks.loop(hours=24)
+    async def archive_old_rows(self):
+        try:
+            before = datetime.now() - timedelta(days=self.bot.config.RETENTION_DAYS)
+            moved = await self.db.archive_old_rows(before)
+            if moved:
+                print(f"Archived rows per season: {moved}")
+        except Exception as e:
+            print(f"Error in archive_old_rows: {e}")
+
+    @archive_old_rows.before_loop
+    async def before_archive_old_rows(self):
+        await self.bot.wait_until_ready()
+
+    @tasks.loop(hours=6)
+    async def backup_database(self):
+        try:
+            name, checksum = await self.db.create_backup(keep=self.bot.config.BACKUP_KEEP)
+            print(f"Database backed up to {name} (sha256 {checksum[:12]})")
+        except Exception as e:
+            print(f"Error in backup_database: {e}")
+
+    @backup_database.before_loop
+    async def before_backup_database(self):
+        await self.bot.wait_until_ready()
 
     @commands.command(aliases=["revert"])
     @commands.has_role("Admin")
     async def revert_result(self, ctx, match_id: int, silent: bool = False):
         try:
-            self.db.cursor.execute("""
-                SELECT player1, player2, winner, GameModeID, 
-                       elo_before_winner, elo_after_winner,
-                       elo_before_loser, elo_after_loser
-                FROM match_history
-                WHERE id = ?
-            """, (match_id,))
-            match = self.db.cursor.fetchone()
+            match = await self.db.revert_match(match_id)
 
             if not match:
                 await ctx.send(f"No match found with ID {match_id}")
@@ -34,32 +57,12 @@ class Admin(commands.Cog):
 
             player1, player2, winner, GameModeID, elo_before_winner, elo_after_winner, elo_before_loser, elo_after_loser = match
 
-            self.db.cursor.execute("""
-                UPDATE player_ratings 
-                SET elo = ?, matches = matches - 1, wins = wins - 1
-                WHERE player_id = ? AND GameModeID = ?
-            """, (elo_before_winner, winner, GameModeID))
-
-            self.db.cursor.execute("""
-                UPDATE player_ratings 
-                SET elo = ?, matches = matches - 1
-                WHERE player_id = ? AND GameModeID = ?
-            """, (elo_before_loser, player2 if winner == player1 else player1, GameModeID))
-
-            self.db.cursor.execute("DELETE FROM bets WHERE match_id = ?", (match_id,))
-            self.db.conn.commit()
-
-            player1_discord_id = self.db.cursor.execute(
-                "SELECT discord_id FROM players WHERE id = ?",
-                (player1,)
-            ).fetchone()[0]
-            player2_discord_id = self.db.cursor.execute(
-                "SELECT discord_id FROM players WHERE id = ?",
-                (player2,)
-            ).fetchone()[0]
-
-            player1_user = await self.bot.fetch_user(player1_discord_id)
-            player2_user = await self.bot.fetch_user(player2_discord_id)
+            player1_discord_id = await self.db.get_discord_id(player1)
+            player2_discord_id = await self.db.get_discord_id(player2)
+
+            users = await resolve_users(self.bot, [player1_discord_id, player2_discord_id], ctx.guild)
+            player1_user = users[player1_discord_id]
+            player2_user = users[player2_discord_id]
 
             player1_name = player1_user.name
             player2_name = player2_user.name
@@ -69,7 +72,7 @@ class Admin(commands.Cog):
                 await ctx.send(
                     f"✅ Successfully reverted match #{match_id} ({player1_name} vs {player2_name}, winner: {winner_name})"
                 )
-            await self.bot.get_cog('Leaderboard').update_leaderboard(GameModeID)
+            self.bot.dispatch("ratings_changed", GameModeID)
 
         except (discord.HTTPException, discord.Forbidden) as e:
             await ctx.send(f"Error reverting match: {e}")
@@ -80,56 +83,22 @@ class Admin(commands.Cog):
     @commands.has_role("Admin")
     async def edit_match_result(self, ctx, match_id: int, new_winner: discord.Member):
         try:
-            self.db.cursor.execute("""
-                SELECT player1, player2, GameModeID
-                FROM match_history
-                WHERE id = ?
-            """, (match_id,))
-            match = self.db.cursor.fetchone()
+            match = await self.db.get_match_history_entry(match_id)
 
             if not match:
                 await ctx.send(f"No match found with ID {match_id}")
                 return
 
-            player1_db_id, player2_db_id, GameModeID = match
-
-            player1_discord_id = self.db.get_discord_id(player1_db_id)
-            player2_discord_id = self.db.get_discord_id(player2_db_id)
-
-            await self.revert_result(ctx, match_id, silent=True)
-
-            new_loser = None
-            if new_winner.id == player1_discord_id:
-                new_loser_id = player2_discord_id
-            elif new_winner.id == player2_discord_id:
-                new_loser_id = player1_discord_id
-            else:
+            GameModeID = await self.db.edit_match_result(match_id, new_winner.id)
+            if not GameModeID:
                 await ctx.send(f"{new_winner.mention} was not a participant in match #{match_id}.")
                 return
-            
-            new_loser = await self.bot.fetch_user(new_loser_id)
-
-            winner_rating_before = self.db.get_player_rating(new_winner.id, GameModeID)
-            loser_rating_before = self.db.get_player_rating(new_loser.id, GameModeID)
-
-            new_winner_rating, new_loser_rating = update_elo(winner_rating_before, loser_rating_before)
-
-            self.db.record_match_result(
-                new_winner.id,
-                new_loser.id,
-                GameModeID,
-                winner_rating_before,
-                new_winner_rating,
-                loser_rating_before,
-                new_loser_rating,
-                match_id=match_id
-            )
 
             await ctx.send(
                 f"✅ Match #{match_id} result edited: {new_winner.mention} is now the winner."
             )
 
-            await self.bot.get_cog('Leaderboard').update_leaderboard(GameModeID)
+            self.bot.dispatch("ratings_changed", GameModeID)
 
         except Exception as e:
             await ctx.send(f"Error editing match result: {str(e)}")
@@ -138,40 +107,29 @@ class Admin(commands.Cog):
     @commands.has_role("Admin")
     async def admin_list_matches(self, ctx, limit: int = 10):
         try:
-            self.db.cursor.execute("""
-                SELECT mh.id, 
-                       (SELECT discord_id FROM players WHERE id = mh.player1) as player1_id,
-                       (SELECT discord_id FROM players WHERE id = mh.player2) as player2_id,
-                       (SELECT discord_id FROM players WHERE id = mh.winner) as winner_id,
-                       g.name as mode,
-                       mh.datetime
-                FROM match_history mh
-                JOIN gamemode g ON mh.GameModeID = g.id
-                ORDER BY mh.id DESC
-                LIMIT ?
-            """, (limit,))
-
-            matches = self.db.cursor.fetchall()
+            matches = await self.db.get_recent_matches(limit)
 
             if not matches:
                 await ctx.send("No matches found in history.")
                 return
 
             response = ["📜 **Recent Matches (Admin View)**"]
-            for match_id, player1_id, player2_id, winner_id, mode, datetime in matches:
+            users = await resolve_users(self.bot, [player_id for match in matches for player_id in match[1:4]],
+                                        ctx.guild)
+            for match_id, player1_id, player2_id, winner_id, mode, played_at in matches:
                 try:
-                    player1 = await self.bot.fetch_user(player1_id)
-                    player2 = await self.bot.fetch_user(player2_id)
-                    winner = await self.bot.fetch_user(winner_id)
+                    player1 = users[player1_id]
+                    player2 = users[player2_id]
+                    winner = users[winner_id]
 
                     response.append(
                         f"`#{match_id}` {player1.name} vs {player2.name} | "
-                        f"Winner: {winner.name} | Mode: {mode} | {datetime}"
+                        f"Winner: {winner.name} | Mode: {mode} | {played_at}"
                     )
                 except:
                     response.append(
                         f"`#{match_id}` Player {player1_id} vs Player {player2_id} | "
-                        f"Winner: Player {winner_id} | Mode: {mode} | {datetime}"
+                        f"Winner: Player {winner_id} | Mode: {mode} | {played_at}"
                     )
 
             await ctx.send("\n".join(response))
@@ -188,14 +146,14 @@ class Admin(commands.Cog):
                 await ctx.send("Invalid mode. Valid modes: land, conquest, domination, luckydice")
                 return
 
-            old_elo = self.db.get_player_rating(member.id, GameModeID)
-            self.db.update_elo(member.id, GameModeID, new_elo)
+            old_elo = await self.db.get_player_rating(member.id, GameModeID)
+            await self.db.update_elo(member.id, GameModeID, new_elo)
 
             await ctx.send(
                 f"✅ Adjusted {member.mention}'s {mode} ELO from {old_elo} to {new_elo}"
             )
 
-            await self.bot.get_cog('Leaderboard').update_leaderboard(GameModeID)
+            self.bot.dispatch("ratings_changed", GameModeID)
 
         except Exception as e:
             await ctx.send(f"Error adjusting ELO: {str(e)}")
@@ -204,12 +162,12 @@ class Admin(commands.Cog):
     @commands.has_role("Admin")
     async def edittokens(self, ctx, amount: int, member: discord.Member):
         try:
-            player_id = self.db.get_player_id(member.id)
+            player_id = await self.db.get_player_id(member.id)
             if not player_id:
                 await ctx.send(f"Player {member.mention} not found in the database.")
                 return
 
-            self.db.update_player_balance(player_id, amount)
+            await self.db.update_player_balance(player_id, amount)
             await ctx.send(f"✅ Successfully set {member.mention}'s tokens to {amount}.")
 
         except Exception as e:
@@ -219,17 +177,109 @@ class Admin(commands.Cog):
     @commands.has_role("Admin")
     async def check_tokens(self, ctx, member: discord.Member):
         try:
-            player_id = self.db.get_player_id(member.id)
+            player_id = await self.db.get_player_id(member.id)
             if not player_id:
                 await ctx.send(f"Player {member.mention} not found in the database.")
                 return
 
-            balance = self.db.get_player_balance(player_id)
+            balance = await self.db.get_player_balance(player_id)
             await ctx.send(f"{member.mention} has {balance} tokens.")
 
         except Exception as e:
             await ctx.send(f"Error checking tokens: {str(e)}")
 
+    @commands.command(aliases=["dbstats"])
+    @commands.has_role("Admin")
+    async def db_stats(self, ctx):
+        identity = self.db.identity_map.stats()
+        await ctx.send(
+            f"🗃️ Identity map: {identity['size']}/{identity['capacity']} players | "
+            f"{identity['hits']} hits / {identity['misses']} misses ({identity['hit_rate']}% hit rate)"
+        )
+
+    @commands.command(aliases=["mmstats"])
+    @commands.has_role("Admin")
+    async def matchmaking_stats(self, ctx):
+        response = ["⚖️ **Matchmaking quality**"]
+        for GameModeID, mode_name in REVERSE_MODE_MAP.items():
+            quality = self.bot.queue.match_quality(GameModeID)
+            response.append(
+                f"- {mode_name}: {quality['queued']} queued | {quality['matches']} matches | "
+                f"avg gap **{quality['avg_gap']}** ELO (max {quality['max_gap']}) | avg wait {quality['avg_wait']}s"
+            )
+        await ctx.send("\n".join(response))
+
+    @commands.command(aliases=["recompute"])
+    @commands.has_role("Admin")
+    async def recompute_ratings(self, ctx, mode: str):
+        GameModeID = self.mode_map.get(mode.lower())
+        if not GameModeID:
+            await ctx.send("Invalid mode. Valid modes: land, conquest, domination, luckydice")
+            return
+
+        try:
+            replayed, changed_matches, changed_players = await self.db.recompute_ratings(GameModeID)
+            await ctx.send(
+                f"🔁 Replayed {replayed} {mode} matches: {changed_matches} match(es) and "
+                f"{changed_players} player rating(s) corrected."
+            )
+            if changed_players:
+                self.bot.dispatch("ratings_changed", GameModeID)
+        except Exception as e:
+            await ctx.send(f"Error recomputing ratings: {str(e)}")
+
+    @commands.command(aliases=["archive"])
+    @commands.has_role("Admin")
+    async def archive_history(self, ctx, days: int = None):
+        days = self.bot.config.RETENTION_DAYS if days is None else days
+        try:
+            moved = await self.db.archive_old_rows(datetime.now() - timedelta(days=days))
+            if not moved:
+                await ctx.send(f"Nothing older than {days} days to archive.")
+                return
+            seasons = ", ".join(f"{season}: {count}" for season, count in moved.items())
+            await ctx.send(f"🗄️ Archived {sum(moved.values())} rows older than {days} days ({seasons}).")
+        except Exception as e:
+            await ctx.send(f"Error archiving history: {str(e)}")
+
+    @commands.command(aliases=["backup"])
+    @commands.has_role("Admin")
+    async def backup_now(self, ctx):
+        try:
+            name, checksum = await self.db.create_backup(keep=self.bot.config.BACKUP_KEEP)
+            await ctx.send(f"💾 Backup `{name}` created (sha256 `{checksum[:12]}`).")
+        except Exception as e:
+            await ctx.send(f"Error creating backup: {str(e)}")
+
+    @commands.command(aliases=["backups"])
+    @commands.has_role("Admin")
+    async def list_backups(self, ctx):
+        backups = self.db.list_backups()
+        if not backups:
+            await ctx.send("No backups found.")
+            return
+
+        response = ["💾 **Backups (newest first)**"]
+        for name, size in backups:
+            response.append(f"- `{name}` ({size / 2 ** 20:.1f} MB)")
+        await ctx.send("\n".join(response))
+
+    @commands.command(aliases=["restore"])
+    @commands.has_role("Admin")
+    async def restore_backup(self, ctx, name: str):
+        try:
+            safety_name = await self.db.restore_backup(name, keep=self.bot.config.BACKUP_KEEP)
+            if not safety_name:
+                await ctx.send(f"Backup `{name}` not found or failed its checksum.")
+                return
+
+            await self.bot.resync_state()
+            await ctx.send(f"✅ Restored `{name}`. The previous state was saved as `{safety_name}`.")
+            for GameModeID in set(self.mode_map.values()):
+                self.bot.dispatch("ratings_changed", GameModeID)
+        except Exception as e:
+            await ctx.send(f"Error restoring backup: {str(e)}")
+
 
 async def setup(bot):
     await bot.add_cog(Admin(bot))
@@ -1,17 +1,18 @@
 import discord
 from discord.ext import commands
-from database import Database
+
+from utils.users import resolve_users
 
 class Betting(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
 
     @commands.command()
     async def balance(self, ctx):
-        user_id = self.db.get_player_id(ctx.author.id)
+        user_id = await self.db.get_player_id(ctx.author.id)
         if user_id:
-            balance = self.db.get_player_balance(user_id)
+            balance = await self.db.get_player_balance(user_id)
             await ctx.send(f"{ctx.author.mention}, you have {balance} tokens.")
         else:
             await ctx.send("You are not registered in the system.")
@@ -26,18 +27,18 @@ class Betting(commands.Cog):
             return
 
         bettor_id = ctx.author.id
-        self.db.add_player(bettor_id)
+        await self.db.add_player(bettor_id)
 
-        bettor_player_id = self.db.get_player_id(bettor_id)
+        bettor_player_id = await self.db.get_player_id(bettor_id)
         if bettor_player_id is None:
             await ctx.send("You are not registered in the system.")
             return
 
-        bettor_match_id = self.db.get_active_match(bettor_id)
+        bettor_match_id = await self.db.get_active_match(bettor_id)
 
         bet_side = member.id
 
-        bet_side_match_id = self.db.get_active_match(bet_side)
+        bet_side_match_id = await self.db.get_active_match(bet_side)
         if bet_side_match_id is None:
             await ctx.send(f"{member.mention} is not in an active match.")
             return
@@ -47,19 +48,17 @@ class Betting(commands.Cog):
             return
 
         if bettor_match_id is not None:
-            bettor_opponent_id = self.db.get_opponent_id(bettor_id, bettor_match_id)
+            bettor_opponent_id = await self.db.get_opponent_id(bettor_id, bettor_match_id)
 
             if bet_side == bettor_opponent_id:
                 await ctx.send(f"You cannot bet on your current opponent ({member.mention}).")
                 return
 
-        self.db.cursor.execute("SELECT id FROM bets WHERE bettor_id = ? AND match_id = ?", (bettor_id, bet_side_match_id))
-        existing_bet = self.db.cursor.fetchone()
-        if existing_bet:
+        if await self.db.has_bet(bettor_id, bet_side_match_id):
             await ctx.send("You have already placed a bet on this match.")
             return
 
-        balance = self.db.get_player_balance(bettor_player_id)
+        balance = await self.db.get_player_balance(bettor_player_id)
         if balance < amount:
             await ctx.send("You do not have enough tokens to place this bet.")
             return
@@ -68,8 +67,7 @@ class Betting(commands.Cog):
             await ctx.send("Invalid betting amount.")
             return
 
-        self.db.update_player_balance(bettor_id, balance - amount)
-        self.db.place_bet(bettor_id, bet_side_match_id, bet_side, amount)
+        await self.db.place_bet(bettor_id, bet_side_match_id, bet_side, amount)
 
         await ctx.send(f"{ctx.author.mention} placed a bet of {amount} tokens on {member.mention}.")
 
@@ -77,24 +75,14 @@ class Betting(commands.Cog):
     async def bet_history(self, ctx):
         user_id = ctx.author.id
         if user_id:
-            self.db.cursor.execute("""
-                SELECT b.match_id, b.bet_side, b.amount, b.placed_at, b.resolved, p.discord_id 
-                FROM bets b
-                INNER JOIN players p ON b.bet_side = p.id
-                WHERE b.bettor_id = ?
-            """, (self.db.get_player_id(user_id),))
-            bets = self.db.cursor.fetchall()
+            bets = await self.db.get_bet_history(await self.db.get_player_id(user_id))
             if bets:
                 response = [":scroll: **Your Bet History**"]
+                users = await resolve_users(self.bot, [bet[5] for bet in bets], ctx.guild)
                 for bet in bets:
                     match_id, bet_side, amount, placed_at, resolved, bet_side_discord_id = bet
                     status = "Resolved" if resolved else "Pending"
-                    bet_side_member = ctx.guild.get_member(bet_side_discord_id)
-                    if not bet_side_member:
-                        try:
-                            bet_side_member = await self.bot.fetch_user(bet_side_discord_id)
-                        except Exception:
-                            bet_side_member = None
+                    bet_side_member = users.get(bet_side_discord_id)
                     bet_side_name = bet_side_member.name if bet_side_member else f"Unknown Player ({bet_side_discord_id})"
                     response.append(f"• Match {match_id}: Bet on {bet_side_name} for {amount} tokens ({status})")
                 await ctx.send("\n".join(response))
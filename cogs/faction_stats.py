@@ -1,26 +1,67 @@
+import asyncio
+
 import discord
 from discord.ext import commands
-from database import Database
+from outbound import BOARD
 from utils.maps import factions
 
 class FactionStats(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
         self.channel_id = 1424864456063848608
+        self.lock = asyncio.Lock()
+        self.sent_chunks = []
 
     async def update_faction_stats_message(self):
-        stats = self.db.get_faction_stats()
-        channel = self.bot.get_channel(self.channel_id)
-
-        if not channel:
-            print(f"Channel with ID {self.channel_id} not found.")
-            return
-
-        if not stats:
-            await channel.send("No faction stats available yet.")
-            return
-
+        # The board is a fixed list of messages edited in place; only chunks
+        # whose text changed are edited, and messages are only sent or
+        # deleted when the number of chunks changes.
+        async with self.lock:
+            channel = self.bot.get_channel(self.channel_id)
+
+            if not channel:
+                print(f"Channel with ID {self.channel_id} not found.")
+                return
+
+            faction_stats = self.db.faction_stats
+            stats = [(faction_name, wins, losses) for faction_name, (wins, losses) in faction_stats.items()]
+            if not stats:
+                chunks = ["No faction stats available yet."]
+            else:
+                chunks = self.render_chunks(stats)
+
+            message_ids = self.bot.boards.get("faction_stats", channel.id)
+            if not message_ids and not self.sent_chunks:
+                # Boards posted before message IDs were stored.
+                async for msg in channel.history(limit=100):
+                    if msg.author == self.bot.user:
+                        await self.bot.outbound.delete(msg)
+
+            for position, chunk in enumerate(chunks):
+                if position < len(message_ids):
+                    if position < len(self.sent_chunks) and self.sent_chunks[position] == chunk:
+                        continue
+                    try:
+                        await self.bot.outbound.edit(channel.get_partial_message(message_ids[position]), content=chunk)
+                        continue
+                    except discord.NotFound:
+                        # Deleted by hand: the chunk and everything after it
+                        # are posted again so the board stays in order.
+                        for message_id in message_ids[position + 1:]:
+                            await self._delete(channel, message_id)
+                        del message_ids[position:]
+                message_ids.append((await self.bot.outbound.send(channel, chunk, priority=BOARD)).id)
+
+            for message_id in message_ids[len(chunks):]:
+                await self._delete(channel, message_id)
+            del message_ids[len(chunks):]
+
+            self.sent_chunks = chunks
+            await self.bot.boards.set("faction_stats", channel.id, message_ids)
+
+    @staticmethod
+    def render_chunks(stats):
         message_header = "**Global Faction Win Rates (Lucky Dice):**\n\n"
         sorted_stats = sorted(
             stats,
@@ -35,19 +76,23 @@ class FactionStats(commands.Cog):
             line = f"{factions[faction_name]} **{faction_name}** {factions[faction_name]}: {win_rate:.2f}% [ {wins}W / {losses}L ]"
             lines.append(line)
 
-        async for msg in channel.history(limit=100):
-            if msg.author == self.bot.user:
-                await msg.delete()
-
+        chunks = []
         current_message = message_header
         for line in lines:
             if len(current_message) + len(line) + 1 > 2000:
-                await channel.send(current_message)
+                chunks.append(current_message)
                 current_message = ""
             current_message += line + "\n"
 
         if current_message.strip():
-            await channel.send(current_message)
+            chunks.append(current_message)
+        return chunks
+
+    async def _delete(self, channel, message_id):
+        try:
+            await self.bot.outbound.delete(channel.get_partial_message(message_id))
+        except discord.NotFound:
+            pass
 
     @commands.command()
     @commands.has_permissions(administrator=True)
@@ -64,7 +109,7 @@ class FactionStats(commands.Cog):
 
     @commands.command(aliases=["mfs"])
     async def myfactionstats(self, ctx):
-        stats = self.db.get_player_faction_stats(ctx.author.id)
+        stats = await self.db.get_player_faction_stats(ctx.author.id)
 
         if not stats:
             await ctx.send("You have no faction stats available yet.")
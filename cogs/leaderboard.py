@@ -1,19 +1,63 @@
 import discord
 from discord.ext import commands
 import matplotlib.pyplot as plt
+import asyncio
 import io
+import time
 import seaborn as sns
 import pandas as pd
-from database import Database
 
+from outbound import BOARD
 from utils.maps import MODE_MAP, REVERSE_MODE_MAP
+from utils.users import resolve_users
 
 class Leaderboard(commands.Cog):
+    # Leaderboard channels are refreshed in the background: a rating change
+    # marks its mode dirty, and each mode is redrawn at most once per
+    # REFRESH_INTERVAL seconds, after waiting REFRESH_DELAY seconds for
+    # further results.
+    REFRESH_DELAY = 2.0
+    REFRESH_INTERVAL = 30.0
+
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
         self.mode_map = MODE_MAP
         self.reverse_mode_map = REVERSE_MODE_MAP
+        self.rendered = {}
+        self.dirty = set()
+        self.last_refresh = {}
+        self._refreshers = {}
+
+    def cog_unload(self):
+        for task in self._refreshers.values():
+            task.cancel()
+
+    @commands.Cog.listener()
+    async def on_ratings_changed(self, GameModeID):
+        self.mark_dirty(GameModeID)
+
+    @commands.Cog.listener()
+    async def on_perks_changed(self):
+        for GameModeID in set(self.mode_map.values()):
+            self.mark_dirty(GameModeID)
+
+    def mark_dirty(self, GameModeID):
+        self.dirty.add(GameModeID)
+        task = self._refreshers.get(GameModeID)
+        if task is None or task.done():
+            self._refreshers[GameModeID] = asyncio.create_task(self._refresh(GameModeID))
+
+    async def _refresh(self, GameModeID):
+        while GameModeID in self.dirty:
+            wait = self.last_refresh.get(GameModeID, 0) + self.REFRESH_INTERVAL - time.monotonic()
+            await asyncio.sleep(max(wait, self.REFRESH_DELAY))
+            self.dirty.discard(GameModeID)
+            self.last_refresh[GameModeID] = time.monotonic()
+            try:
+                await self.update_leaderboard(GameModeID)
+            except Exception as e:
+                print(f"Error refreshing leaderboard for GameModeID {GameModeID}: {e}")
 
     @commands.command(aliases=["lb", "leaderboard", "top", "LB", "Lb", "Top"])
     async def leaders(self, ctx, mode: str = " "):
@@ -28,18 +72,21 @@ class Leaderboard(commands.Cog):
             return await ctx.send("Invalid mode.")
 
         try:
-            leaderboard = self.db.get_leaderboard(GameModeID)
+            version = self.db.rating_version(GameModeID)
+            cached = self.rendered.get(("leaders", GameModeID))
+            if cached and cached[0] == version:
+                return await ctx.send(cached[1])
+
+            leaderboard = await self.db.get_leaderboard(GameModeID)
             if not leaderboard:
                 return await ctx.send(f"The leaderboard for {mode} mode is empty.")
 
             response = [f"🏆 **Top players ({mode})**"]
+            users = await resolve_users(self.bot, [row[0] for row in leaderboard[:10]], ctx.guild)
 
             for idx, (player_id, elo, matches, wins) in enumerate(leaderboard[:10], 1):
-                try:
-                    user = await self.bot.fetch_user(player_id)
-                    display_name = user.display_name
-                except discord.NotFound:
-                    display_name = f"Player {player_id}"
+                user = users.get(player_id)
+                display_name = user.display_name if user else f"Player {player_id}"
 
                 if matches > 0:
                     win_rate = round((wins / matches) * 100, 1)
@@ -50,7 +97,9 @@ class Leaderboard(commands.Cog):
                     f"{idx}. {display_name} - **{int(elo)}** ELO | 🏅 WR: **{win_rate}%** ({wins} / {matches})"
                 )
 
-            await ctx.send("\n".join(response))
+            text = "\n".join(response)
+            self.rendered[("leaders", GameModeID)] = (version, text)
+            await ctx.send(text)
         except (discord.HTTPException, discord.Forbidden) as e:
             await ctx.send(f"Error fetching leaderboard: {e}")
         except Exception as e:
@@ -59,7 +108,7 @@ class Leaderboard(commands.Cog):
     @commands.command(aliases=["h", "H"])
     async def history(self, ctx, limit: int = 11):
         try:
-            matches = self.db.get_match_history(ctx.author.id, limit)
+            matches = await self.db.get_match_history(ctx.author.id, limit, include_archived=True)
             if not matches:
                 return await ctx.send("Match history is empty.")
 
@@ -67,18 +116,11 @@ class Leaderboard(commands.Cog):
             for match in matches:
                 player_ids.update([match[0], match[1], match[2]])
 
-            users = {}
-            for player_id in player_ids:
-                if player_id is None:
-                    continue
-                try:
-                    user = await self.bot.fetch_user(player_id)
-                    users[player_id] = user.display_name
-                except discord.NotFound:
-                    users[player_id] = f"Player {player_id}"
-                except discord.HTTPException as e:
-                    print(f"Error fetching user {player_id}: {e}")
-                    users[player_id] = f"Player {player_id}"
+            users = {
+                player_id: user.display_name
+                for player_id, user in (await resolve_users(self.bot, player_ids, ctx.guild)).items()
+                if user is not None
+            }
 
             response = ["📜 **Recent matches**"]
             for player1_discord_id, player2_discord_id, winner_discord_id, GameModeID, elo_before_winner, elo_after_winner, elo_before_loser, elo_after_loser in matches:
@@ -128,7 +170,7 @@ class Leaderboard(commands.Cog):
                 "lt": "lucky-test"
             }.get(mode, mode)
 
-            elo_data = self.db.get_player_elo_history(ctx.author.id, GameModeID)
+            elo_data = await self.db.get_player_elo_history(ctx.author.id, GameModeID, include_archived=True)
             print(f"ELO data for {ctx.author.id} in GameModeID {GameModeID}: {elo_data}")
 
             if not elo_data:
@@ -167,14 +209,12 @@ class Leaderboard(commands.Cog):
             elo_data = []
             for mode_name, GameModeID in self.mode_map.items():
                 if len(mode_name) > 2:  # Only use full mode names (e.g., "land", "conquest", "domination")
-                    elo = self.db.get_player_rating(player_id, GameModeID)
+                    standing = await self.db.get_player_standing(player_id, GameModeID)
 
-                    if elo == "N/A":
-                        elo_data.append((mode_name.capitalize(), elo, "N/A", "N/A", "N/A"))
+                    if standing is None:
+                        elo_data.append((mode_name.capitalize(), "N/A", "N/A", "N/A", "N/A"))
                     else:
-                        win_rate = self.db.get_winrate(player_id, GameModeID)
-                        player_rank, total_players = self.db.get_player_rank(player_id, GameModeID)
-                        top_percentile = round((player_rank / total_players) * 100, 1) if total_players else 100
+                        elo, win_rate, player_rank, total_players, top_percentile = standing
                         elo_data.append((mode_name.capitalize(), elo, win_rate, top_percentile, player_rank))
 
             response = [f"🏆 **{ctx.author.name}'s ELO Ratings**"]
@@ -205,24 +245,30 @@ class Leaderboard(commands.Cog):
             return
 
         try:
-            leaderboard = self.db.get_leaderboard(GameModeID)
+            version = (self.db.rating_version(GameModeID), self.db.perk_version)
+            cached = self.rendered.get(("channel", GameModeID))
+            if cached and cached[0] == version:
+                return
+
+            leaderboard = await self.db.get_leaderboard(GameModeID)
 
             if not leaderboard:
-                await channel.send(f"The leaderboard for {GameModeID} mode is empty.")
+                await self.bot.boards.edit_or_send(channel, "leaderboard", GameModeID,
+                                                   content=f"The leaderboard for {GameModeID} mode is empty.")
                 return
 
             response = [f"🏆 **Top players**"]
+            player_ids = [row[0] for row in leaderboard]
+            users = await resolve_users(self.bot, player_ids, channel.guild)
+            highlighted = await self.db.get_highlighted_players(player_ids)
 
             for idx, (player_id, elo, matches, wins) in enumerate(leaderboard[:], 1):
-                try:
-                    user = await self.bot.fetch_user(player_id)
+                user = users.get(player_id)
+                if user is not None:
                     display_name = user.display_name
-                    db_player_id = self.db.get_player_id(player_id)
-                    perks = self.db.get_player_perks(db_player_id)
-                    for perk_type, data in perks:
-                        if perk_type == 'highlight':
-                            display_name = f"**{display_name}** ✨"
-                except discord.NotFound:
+                    if player_id in highlighted:
+                        display_name = f"**{display_name}** ✨"
+                else:
                     display_name = f"Player {player_id}"
 
                 if matches > 0:
@@ -234,14 +280,12 @@ class Leaderboard(commands.Cog):
                     f"{idx}. {display_name} - **{int(elo)}** ELO | 🏅 WR: **{win_rate}%** ({wins} / {matches})"
                 )
 
-            async for message in channel.history(limit=1):
-                await message.edit(content="\n".join(response))
-                return
-
-            await channel.send("\n".join(response))
+            text = "\n".join(response)
+            await self.bot.boards.edit_or_send(channel, "leaderboard", GameModeID, content=text)
+            self.rendered[("channel", GameModeID)] = (version, text)
 
         except Exception as e:
-            await channel.send(f"Error fetching leaderboard: {str(e)}")
+            await self.bot.outbound.send(channel, f"Error fetching leaderboard: {str(e)}", priority=BOARD)
 
 async def setup(bot):
     await bot.add_cog(Leaderboard(bot))
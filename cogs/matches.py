@@ -1,13 +1,16 @@
+import asyncio
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 import random
-from database import Database
 from logic import update_elo
 import re
-from datetime import datetime, timedelta
 
+from outbound import BOARD, DM, MATCH_SETUP
 from utils.maps import MODE_MAP, REVERSE_MODE_MAP, domination_constant_maps, season0_domination_maps, conquest_maps, \
     land_maps, factions
+from utils.users import resolve_users
+
+RULES_LINK = re.compile(r"https://(?:discord|discordapp).com/channels/\d+/(\d+)/(\d+)")
 
 
 class FactionSelectView(discord.ui.View):
@@ -86,13 +89,13 @@ class SubmitButton(discord.ui.Button):
             await interaction.response.send_message("This is not for you.", ephemeral=True)
             return
 
-        self.view_ref.db.update_luckydice_selection(self.view_ref.match_id, self.view_ref.player_id,
-                                                    self.view_ref.selected_factions)
+        await self.view_ref.db.update_luckydice_selection(self.view_ref.match_id, self.view_ref.player_id,
+                                                          self.view_ref.selected_factions)
         for item in self.view_ref.children:
             item.disabled = True
         await interaction.response.edit_message(content="Your selections have been submitted.", view=self.view_ref)
 
-        selections = self.view_ref.db.get_luckydice_selections(self.view_ref.match_id)
+        selections = await self.view_ref.db.get_luckydice_selections(self.view_ref.match_id)
         if selections and selections[7] and selections[8]:
             player1_factions = selections[5].split(',')
             player2_factions = selections[6].split(',')
@@ -100,10 +103,11 @@ class SubmitButton(discord.ui.Button):
             maps = self.view_ref.maps
             player1_id = selections[1]
             player2_id = selections[2]
-            player1 = await self.bot.fetch_user(player1_id)
-            player2 = await self.bot.fetch_user(player2_id)
+            users = await resolve_users(self.bot, [player1_id, player2_id], interaction.guild)
+            player1 = users[player1_id]
+            player2 = users[player2_id]
 
-            message_id = self.view_ref.db.get_match_message_id(self.view_ref.match_id)
+            message_id = await self.view_ref.db.get_match_message_id(self.view_ref.match_id)
             if message_id:
                 try:
                     channel = self.view_ref.bot.get_channel(interaction.channel.id)
@@ -112,7 +116,7 @@ class SubmitButton(discord.ui.Button):
                         view = discord.ui.View.from_message(message)
                         for item in view.children:
                             item.disabled = True
-                        await message.edit(view=view)
+                        await self.bot.outbound.edit(message, priority=MATCH_SETUP, view=view)
                 except (discord.NotFound, discord.Forbidden):
                     pass
 
@@ -125,7 +129,7 @@ class SubmitButton(discord.ui.Button):
                 map_name = maps[i]
                 message_content += f'{factions[p1_faction_name]} {map_name} {factions[p2_faction_name]}\n'
 
-            await interaction.channel.send(message_content)
+            await self.bot.outbound.send(interaction.channel, message_content, priority=MATCH_SETUP)
 
 
 class InitiateFactionSelectView(discord.ui.View):
@@ -138,7 +142,7 @@ class InitiateFactionSelectView(discord.ui.View):
 
     @discord.ui.button(label="Select Your Factions", style=discord.ButtonStyle.primary)
     async def select_factions(self, interaction: discord.Interaction, button: discord.ui.Button):
-        selections = self.db.get_luckydice_selections(self.match_id)
+        selections = await self.db.get_luckydice_selections(self.match_id)
         if not selections:
             await interaction.response.send_message("This match does not exist.", ephemeral=True)
             return
@@ -156,57 +160,69 @@ class InitiateFactionSelectView(discord.ui.View):
         await interaction.response.send_message(content=view.get_message_content(), view=view, ephemeral=True)
 
 
-from discord.ext import tasks, commands
-
-
 class Matches(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
+        self.match_queue = bot.queue
         self.mode_map = MODE_MAP
         self.reverse_mode_map = REVERSE_MODE_MAP
-        self.check_queue_timeouts.start()
+        self.rules_cache = {}
+        self.rules_messages = {}
 
-    def cog_unload(self):
-        self.check_queue_timeouts.cancel()
-
-    @tasks.loop(minutes=5)
-    async def check_queue_timeouts(self):
+    @commands.Cog.listener()
+    async def on_queue_matched(self, game_mode_id, player1, player2):
+        # Pairs found by the matchmaking sweep rather than by a !q command.
         try:
-            all_queued_players = self.db.get_all_queued_players()
-            for player_info in all_queued_players:
-                discord_id, game_mode_id, timestamp_queued, mode_name = player_info
-
-                queued_time = datetime.fromisoformat(timestamp_queued)
-                if datetime.now() - queued_time > timedelta(hours=2):
-                    self.db.remove_from_queue(discord_id, game_mode_id)
-
-                    user = await self.bot.fetch_user(discord_id)
-                    if user:
-                        await user.send(f"You have been removed from the {mode_name} queue due to inactivity.")
-
+            await self.start_match(game_mode_id, player1, player2)
         except Exception as e:
-            print(f"Error in check_queue_timeouts: {e}")
-
-    @check_queue_timeouts.before_loop
-    async def before_check_queue_timeouts(self):
-        await self.bot.wait_until_ready()
+            print(f"Error starting match between {player1} and {player2}: {e}")
+            await self.requeue_pair(game_mode_id, player1, player2)
+
+    async def requeue_pair(self, game_mode_id, player1, player2):
+        # pop_match took both players out of every queue before start_match
+        # failed. Unless the match was recorded anyway, they go back in this
+        # mode's queue and are told why.
+        opponent, _ = await self.db.get_match_details(player1)
+        if opponent == player2:
+            return
+        mode_name = self.reverse_mode_map.get(game_mode_id, "Unknown Mode")
+        for discord_id in (player1, player2):
+            self.match_queue.add(discord_id, game_mode_id)
+            try:
+                user = self.bot.get_user(discord_id) or await self.bot.fetch_user(discord_id)
+                await self.bot.outbound.send(
+                    user, f"Your {mode_name} match could not be set up, so you have been put back in the queue.",
+                    priority=DM)
+            except Exception as e:
+                print(f"Error notifying {discord_id} of failed match setup: {e}")
+
+    @commands.Cog.listener()
+    async def on_queue_expired(self, discord_id, game_mode_id):
+        # MatchQueue has already removed the player; this only tells them.
+        mode_name = self.reverse_mode_map.get(game_mode_id, "Unknown Mode")
+        try:
+            user = self.bot.get_user(discord_id) or await self.bot.fetch_user(discord_id)
+            await self.bot.outbound.send(user, f"You have been removed from the {mode_name} queue due to inactivity.",
+                                         priority=DM)
+        except Exception as e:
+            print(f"Error notifying {discord_id} of queue timeout: {e}")
 
     @commands.command(aliases=["s", "S"])
     async def status(self, ctx):
         player_id = ctx.author.id
-        queue_statuses = self.db.get_queue_status(player_id)
+        queue_statuses = self.match_queue.modes_of(player_id)
 
         if queue_statuses:
             mode_names = [self.reverse_mode_map.get(qs, "Unknown Mode") for qs in queue_statuses]
             await ctx.send(f"{ctx.author.name}, you are in the queue for the following modes: {', '.join(mode_names)}.")
             return
 
-        match_details = self.db.get_match_details(player_id)
+        match_details = await self.db.get_match_details(player_id)
         if match_details and match_details[0] is not None and match_details[1] is not None:
             opponent, GameModeID = match_details
             mode_name = self.reverse_mode_map.get(GameModeID, "Unknown Mode")
-            thread_id = self.db.get_match_thread(player_id, opponent, GameModeID)
+            thread_id = await self.db.get_match_thread(player_id, opponent, GameModeID)
             if thread_id:
                 thread = self.bot.get_channel(thread_id)
                 if thread:
@@ -217,6 +233,150 @@ class Matches(commands.Cog):
         else:
             await ctx.send(f'{ctx.author.name}, you are not in queue or in a match.')
 
+    async def start_match(self, GameModeID, player1, player2, guild=None):
+        # Opens the thread for a pair taken from the queue. Names, ratings and
+        # rules are gathered concurrently up front and the opening posts are
+        # packed into as few messages as possible, so a pairing usually costs
+        # the thread creation plus one follow-up post.
+        mode_name = self.reverse_mode_map[GameModeID]
+        players = [player1, player2]
+        random.shuffle(players)
+        player1, player2 = players
+
+        forum_channel = self.bot.get_channel(self.bot.config.FORUM_CHANNEL_ID)
+        users, player1_elo, player2_elo, rules = await asyncio.gather(
+            resolve_users(self.bot, players, guild or forum_channel.guild),
+            self.db.get_player_rating(player1, GameModeID),
+            self.db.get_player_rating(player2, GameModeID),
+            self.get_rules(mode_name),
+        )
+        player1_name = users[player1].name
+        player2_name = users[player2].name
+
+        selected_maps = []
+        if mode_name == "domination":
+            if len(domination_constant_maps) >= 2 and len(season0_domination_maps) >= 1:
+                selected_maps.extend(random.sample(domination_constant_maps, 2))
+                selected_maps.append(random.choice(season0_domination_maps))
+                random.shuffle(selected_maps)
+        elif mode_name == "conquest":
+            if len(conquest_maps) >= 3:
+                selected_maps = random.sample(list(conquest_maps.keys()), 3)
+        elif mode_name == "luckydice":
+            if len(conquest_maps) >= 3:
+                selected_maps = random.sample(list(conquest_maps.keys()), 3)
+        elif mode_name == "land":
+            if len(land_maps) >= 3:
+                selected_maps = random.sample(land_maps, 3)
+
+        maps_message = ""
+        if selected_maps:
+            if mode_name in ["conquest", "luckydice"]:
+                maps_message = "**🗺️ Maps for this match:**\n " + "\n".join(
+                    f"> • {name} <#{conquest_maps[name]}>" for name in selected_maps)
+            else:
+                maps_message = "**🗺️ Maps for this match:**\n> • " + "\n> • ".join(selected_maps)
+
+        mode_tag_map = {
+            "land": 1387922476243226635,
+            "conquest": 1387922512385544285,
+            "domination": 1387922530647539842,
+            "luckydice": 1387922551979905054
+        }
+
+        mode_tag_id = mode_tag_map.get(mode_name)
+        mode_tag = next((tag for tag in forum_channel.available_tags if tag.id == mode_tag_id), None)
+        if mode_tag is None:
+            print(f"Could not find the tag for {mode_name} mode.")
+
+        opening, *follow_ups = self.pack_messages([
+            f'Match found: <@{player1}> ({player1_elo} ELO) vs <@{player2}> ({player2_elo} ELO) in {mode_name} mode!',
+            "**🔀 Player Roles (Randomly Assigned):**\n"
+            f"> • **Player 1**: <@{player1}>\n"
+            f"> • **Player 2**: <@{player2}>",
+            rules,
+            maps_message,
+        ])
+
+        thread = await self.bot.outbound.call(
+            MATCH_SETUP, ("send", forum_channel.id), forum_channel.create_thread,
+            name=f"{player1_name} vs {player2_name}",
+            content=opening,
+            applied_tags=[mode_tag] if mode_tag else []
+        )
+
+        async def send_follow_ups():
+            for content in follow_ups:
+                await self.bot.outbound.send(thread.thread, content, priority=MATCH_SETUP)
+
+        match_id, _ = await asyncio.gather(
+            self.db.create_match(player1, player2, GameModeID, thread.thread.id, selected_maps),
+            send_follow_ups(),
+        )
+
+        if mode_name == "luckydice":
+            faction_names = list(factions.keys())
+            random.shuffle(faction_names)
+
+            player1_factions_pool = faction_names[:5]
+            player2_factions_pool = faction_names[5:10]
+
+            await self.db.create_luckydice_match(match_id, player1, player2, player1_factions_pool,
+                                                 player2_factions_pool)
+
+            view = InitiateFactionSelectView(self.db, match_id, selected_maps, self.bot)
+            message = await self.bot.outbound.send(
+                thread.thread, f"<@{player1}> and <@{player2}>, please select your factions.", view=view,
+                priority=MATCH_SETUP)
+            await self.db.update_match_message_id(match_id, message.id)
+
+        return thread.thread, match_id
+
+    @staticmethod
+    def pack_messages(parts, limit=2000):
+        messages = []
+        for part in filter(None, parts):
+            if messages and len(messages[-1]) + 2 + len(part) <= limit:
+                messages[-1] += "\n\n" + part
+            else:
+                messages.append(part)
+        return messages
+
+    async def get_rules(self, mode_name):
+        # Rules posts are fetched once per mode and cached until the post is
+        # edited.
+        if mode_name in self.rules_cache:
+            return self.rules_cache[mode_name]
+
+        message_link = self.bot.config.RULES_MESSAGE_LINKS.get(mode_name)
+        if not message_link or "YOUR_SERVER_ID" in message_link:
+            return f"No rules defined for {mode_name}. Please update the rules message link in `utils/config.py`."
+
+        match = RULES_LINK.match(message_link)
+        if not match:
+            return f"Invalid rules message link format for {mode_name}."
+
+        channel_id, message_id = map(int, match.groups())
+        try:
+            channel = self.bot.get_channel(channel_id)
+            message = await channel.fetch_message(message_id)
+        except (AttributeError, discord.NotFound, discord.Forbidden):
+            return f"Rules for {mode_name} could not be found or accessed."
+
+        self.rules_messages[message_id] = mode_name
+        self.rules_cache[mode_name] = message.content
+        return message.content
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        await asyncio.gather(*(self.get_rules(mode_name) for mode_name in self.bot.config.RULES_MESSAGE_LINKS))
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload):
+        mode_name = self.rules_messages.get(payload.message_id)
+        if mode_name is not None:
+            self.rules_cache.pop(mode_name, None)
+
     @commands.command(aliases=["q", "Q", "Queue"])
     async def queue(self, ctx, *, modes: str):
         if ctx.channel.name != "queue":
@@ -230,7 +390,7 @@ class Matches(commands.Cog):
             await ctx.send("Please specify at least one mode to queue for.")
             return
 
-        self.db.add_player(ctx.author.id)
+        await self.db.add_player(ctx.author.id)
 
         queued_modes = []
         already_in_queue_modes = []
@@ -243,131 +403,29 @@ class Matches(commands.Cog):
                 continue
 
             game_mode_id = self.mode_map[mode_name]
-            self.db.add_player_mode(ctx.author.id, game_mode_id)
+            await self.db.add_player_mode(ctx.author.id, game_mode_id)
 
-            if game_mode_id in self.db.get_queue_status(ctx.author.id):
+            if self.match_queue.contains(ctx.author.id, game_mode_id):
                 already_in_queue_modes.append(mode_name)
                 continue
 
-            match_details = self.db.get_match_details(ctx.author.id)
+            match_details = await self.db.get_match_details(ctx.author.id)
             if match_details and all(match_details):
                 await ctx.send(f"{ctx.author.name}, you are already in a match. Please finish it before queuing again.")
                 return
 
-            self.db.add_to_queue(ctx.author.id, game_mode_id)
-
-            player_count = self.db.get_queue_players_count(game_mode_id)
-
-            if player_count >= 2:
-                queue_players = self.db.get_queue_players(game_mode_id)
-                if len(queue_players) >= 2:
-                    players = [queue_players[0][0], queue_players[1][0]]
-                    random.shuffle(players)
-                    player1, player2 = players[0], players[1]
-
-                    self.db.remove_from_all_queues(player1)
-                    self.db.remove_from_all_queues(player2)
-                    try:
-                        forum_channel = self.bot.get_channel(self.bot.config.FORUM_CHANNEL_ID)
-                        player1_name = (await self.bot.fetch_user(player1)).name
-                        player2_name = (await self.bot.fetch_user(player2)).name
-                        player1_elo = self.db.get_player_rating(player1, game_mode_id)
-                        player2_elo = self.db.get_player_rating(player2, game_mode_id)
-
-                        selected_maps = []
-                        if mode_name == "domination":
-                            if len(domination_constant_maps) >= 2 and len(season0_domination_maps) >= 1:
-                                selected_maps.extend(random.sample(domination_constant_maps, 2))
-                                selected_maps.append(random.choice(season0_domination_maps))
-                                random.shuffle(selected_maps)
-                        elif mode_name == "conquest":
-                            if len(conquest_maps) >= 3:
-                                selected_maps = random.sample(list(conquest_maps.keys()), 3)
-                        elif mode_name == "luckydice":
-                            if len(conquest_maps) >= 3:
-                                selected_maps = random.sample(list(conquest_maps.keys()), 3)
-                        elif mode_name == "land":
-                            if len(land_maps) >= 3:
-                                selected_maps = random.sample(land_maps, 3)
-
-                        maps_message = ""
-                        if selected_maps:
-                            if mode_name in ["conquest", "luckydice"]:
-                                maps_message = "\n\n**🗺️ Maps for this match:**\n " + "\n".join(
-                                    f"> • {name} <#{conquest_maps[name]}>" for name in selected_maps)
-                            else:
-                                maps_message = "\n\n**🗺️ Maps for this match:**\n> • " + "\n> • ".join(selected_maps)
-
-                        mode_tag_map = {
-                            "land": 1387922476243226635,
-                            "conquest": 1387922512385544285,
-                            "domination": 1387922530647539842,
-                            "luckydice": 1387922551979905054
-                        }
-
-                        mode_tag_id = mode_tag_map.get(mode_name)
-                        available_tags = forum_channel.available_tags
-                        mode_tag = next((tag for tag in available_tags if tag.id == mode_tag_id), None)
-
-                        thread = await forum_channel.create_thread(
-                            name=f"{player1_name} vs {player2_name}",
-                            content=f'Match found: <@{player1}> ({player1_elo} ELO) vs <@{player2}> ({player2_elo} ELO) in {mode_name} mode!',
-                            applied_tags=[mode_tag]
-                        )
-
-                        if mode_tag is None:
-                            await ctx.send(f"Could not find the tag for {mode_name} mode.")
-                            return
-
-                        await thread.thread.send(f"""
-                        **🔀 Player Roles (Randomly Assigned):**
-                        > • **Player 1**: <@{player1}>
-                        > • **Player 2**: <@{player2}>
-                        """)
-
-                        match_id = self.db.create_match(player1, player2, game_mode_id, thread.thread.id, selected_maps)
-
-                        message_link = self.bot.config.RULES_MESSAGE_LINKS.get(mode_name)
-                        if message_link and "YOUR_SERVER_ID" not in message_link:
-                            match = re.match(r"https://(?:discord|discordapp).com/channels/\d+/(\d+)/(\d+)",
-                                             message_link)
-                            if match:
-                                channel_id, message_id = map(int, match.groups())
-                                try:
-                                    channel = self.bot.get_channel(channel_id)
-                                    message = await channel.fetch_message(message_id)
-                                    await thread.thread.send(message.content)
-                                except (discord.NotFound, discord.Forbidden):
-                                    await thread.thread.send(f"Rules for {mode_name} could not be found or accessed.")
-                            else:
-                                await thread.thread.send(f"Invalid rules message link format for {mode_name}.")
-                        else:
-                            await thread.thread.send(
-                                f"No rules defined for {mode_name}. Please update the rules message link in `utils/config.py`.")
-
-                        await thread.thread.send(maps_message)
-
-                        if mode_name == "luckydice":
-                            faction_names = list(factions.keys())
-                            random.shuffle(faction_names)
-
-                            player1_factions_pool = faction_names[:5]
-                            player2_factions_pool = faction_names[5:10]
-
-                            self.db.create_luckydice_match(match_id, player1, player2, player1_factions_pool,
-                                                           player2_factions_pool)
-
-                            view = InitiateFactionSelectView(self.db, match_id, selected_maps, self.bot)
-                            message = await thread.thread.send(
-                                f"<@{player1}> and <@{player2}>, please select your factions.", view=view)
-                            self.db.update_match_message_id(match_id, message.id)
-
-                        return
-
-                    except (discord.HTTPException, discord.Forbidden) as e:
-                        await ctx.send(f"Error creating match thread: {e}")
-                    except Exception as e:
-                        await ctx.send(f"An unexpected error occurred while creating the match: {e}")
+            self.match_queue.add(ctx.author.id, game_mode_id)
+
+            pair = self.match_queue.pop_match(game_mode_id, ctx.author.id)
+            if pair:
+                try:
+                    await self.start_match(game_mode_id, *pair, guild=ctx.guild)
+                except (discord.HTTPException, discord.Forbidden) as e:
+                    await ctx.send(f"Error creating match thread: {e}")
+                    await self.requeue_pair(game_mode_id, *pair)
+                except Exception as e:
+                    await ctx.send(f"An unexpected error occurred while creating the match: {e}")
+                    await self.requeue_pair(game_mode_id, *pair)
                 return
             else:
                 queued_modes.append(mode_name)
@@ -389,11 +447,11 @@ class Matches(commands.Cog):
         player_id = ctx.author.id
 
         if modes is None:
-            queue_statuses = self.db.get_queue_status(player_id)
+            queue_statuses = self.match_queue.modes_of(player_id)
             if queue_statuses:
                 left_modes = []
                 for queue_status in queue_statuses:
-                    self.db.mark_as_unqueued(player_id, queue_status)
+                    self.match_queue.leave(player_id, queue_status)
                     mode_name = self.reverse_mode_map.get(queue_status, "Unknown Mode")
                     left_modes.append(mode_name)
                 if left_modes:
@@ -414,8 +472,7 @@ class Matches(commands.Cog):
                     continue
 
                 game_mode_id = self.mode_map[mode_name]
-                if game_mode_id in self.db.get_queue_status(player_id):
-                    self.db.mark_as_unqueued(player_id, game_mode_id)
+                if self.match_queue.leave(player_id, game_mode_id):
                     left_modes.append(mode_name)
                 else:
                     not_in_queue_modes.append(mode_name)
@@ -433,25 +490,21 @@ class Matches(commands.Cog):
                 await ctx.send(full_response)
             return
 
-        match_details = self.db.get_match_details(player_id)
+        match_details = await self.db.get_match_details(player_id)
         if match_details and all(match_details):
             opponent, GameModeID = match_details
             mode_name = self.reverse_mode_map.get(GameModeID, "Unknown Mode")
 
-            match_id = self.db.get_active_match(player_id)
+            match_id = await self.db.get_active_match(player_id)
+            settlement = None
             if match_id:
-                self.db.cursor.execute("SELECT bettor_id, amount FROM bets WHERE match_id = ? AND resolved = FALSE",
-                                       (match_id,))
-                unresolved_bets = self.db.cursor.fetchall()
-
-                for bettor_id, amount in unresolved_bets:
-                    self.db.update_player_balance(self.db.get_player_id(bettor_id),
-                                                  self.db.get_player_balance(self.db.get_player_id(bettor_id)) + amount)
-                self.db.cursor.execute("UPDATE bets SET resolved = TRUE WHERE match_id = ?", (match_id,))
-                self.db.conn.commit()
-
-            self.db.remove_match(player_id, opponent)
-            await ctx.send(f"{ctx.author.name} left the match for {mode_name} mode.")
+                settlement = await self.db.refund_bets(match_id)
+
+            await self.db.remove_match(player_id, opponent)
+            response = f"{ctx.author.name} left the match for {mode_name} mode."
+            if settlement and settlement.bets:
+                response += f" {settlement.bets} bet(s) refunded ({settlement.paid_out} tokens)."
+            await ctx.send(response)
             return
 
         await ctx.send(f"{ctx.author.name}, you are not in queue or in an active match.")
@@ -463,7 +516,7 @@ class Matches(commands.Cog):
                 "Invalid result. Use `!r win` or `!r loss`. For Lucky Dice, use `!r <w/l> <scores>` (e.g., `!r w 101`).")
             return
 
-        match_details = self.db.get_match_details(ctx.author.id)
+        match_details = await self.db.get_match_details(ctx.author.id)
         if not match_details or match_details[0] is None:
             await ctx.send("You are not in an active match.")
             return
@@ -471,7 +524,7 @@ class Matches(commands.Cog):
         opponent, GameModeID = match_details
         mode_name = self.reverse_mode_map.get(GameModeID, "Unknown Mode")
 
-        match_id = self.db.get_active_match(ctx.author.id)
+        match_id = await self.db.get_active_match(ctx.author.id)
         if not match_id:
             await ctx.send("No active match found.")
             return
@@ -500,7 +553,7 @@ class Matches(commands.Cog):
                 winner_id = opponent
                 loser_id = ctx.author.id
 
-            selections = self.db.get_luckydice_selections(match_id)
+            selections = await self.db.get_luckydice_selections(match_id)
             if not selections or not selections[5] or not selections[6]:
                 await ctx.send(
                     "Faction selections are not complete for this match. Please make sure both players have selected their factions.")
@@ -509,20 +562,22 @@ class Matches(commands.Cog):
             player1_factions = selections[5].split(',')
             player2_factions = selections[6].split(',')
 
-            maps = self.db.get_match_maps(match_id)
+            maps = await self.db.get_match_maps(match_id)
 
 
 
             game_results = []
 
-            winner_name = (await self.bot.fetch_user(winner_id)).display_name
-            loser_name = (await self.bot.fetch_user(loser_id)).display_name
+            users = await resolve_users(self.bot, [winner_id, loser_id], ctx.guild)
+            winner_name = users[winner_id].display_name
+            loser_name = users[loser_id].display_name
 
-            winner_rating_before = self.db.get_player_rating(winner_id, GameModeID)
-            loser_rating_before = self.db.get_player_rating(loser_id, GameModeID)
+            winner_rating_before = await self.db.get_player_rating(winner_id, GameModeID)
+            loser_rating_before = await self.db.get_player_rating(loser_id, GameModeID)
             
             current_overall_winner_elo = winner_rating_before
             current_overall_loser_elo = loser_rating_before
+            faction_results = []
 
             for i, score in enumerate(scores):
                 if score == '1':
@@ -568,13 +623,10 @@ class Matches(commands.Cog):
                 winner_faction = p1_faction if game_winner_id == selections[1] else p2_faction
                 loser_faction = p1_faction if game_loser_id == selections[1] else p2_faction
 
-                self.db.update_faction_stats(winner_faction, True)
-                self.db.update_faction_stats(loser_faction, False)
-                self.db.update_player_faction_stats(game_winner_id, winner_faction, True)
-                self.db.update_player_faction_stats(game_loser_id, loser_faction, False)
+                faction_results.append((game_winner_id, winner_faction, game_loser_id, loser_faction))
 
-                game_winner_name = (await self.bot.fetch_user(game_winner_id)).display_name
-                game_loser_name = (await self.bot.fetch_user(game_loser_id)).display_name
+                game_winner_name = users[game_winner_id].display_name
+                game_loser_name = users[game_loser_id].display_name
 
                 game_results.append(
                     f"{maps[i]}: ||@{game_winner_name} ({factions[winner_faction]}) defeats @{game_loser_name} ({factions[loser_faction]})||")
@@ -584,28 +636,30 @@ class Matches(commands.Cog):
 
 
 
-            self.db.record_luckydice_match(
+            settlement = await self.db.finish_match(
+                match_id,
                 winner_id,
                 loser_id,
                 GameModeID,
                 winner_rating_before,
                 new_winner_rating,
                 loser_rating_before,
-                new_loser_rating
+                new_loser_rating,
+                faction_results=faction_results
             )
 
             response = "**Lucky Dice Match Results:**\n\n"
             response += "\n".join(game_results)
             response += f"\n\nRating change: ||@{winner_name} **{new_winner_rating} **(+{new_winner_rating - winner_rating_before}) | @{loser_name} **{new_loser_rating} **({new_loser_rating - loser_rating_before})||\n\n"
             response += "**Please, both players attach replays to this thread!**"
+            if settlement.bets:
+                response += f"\n\n💰 {settlement.bets} bet(s) settled, {settlement.paid_out} tokens paid out."
 
-            self.db.resolve_bets(match_id, winner_id)
-            self.db.remove_match(winner_id, loser_id)
-            await self.bot.get_cog('Leaderboard').update_leaderboard(GameModeID)
+            self.bot.dispatch("ratings_changed", GameModeID)
             await self.assign_role_based_on_wins(ctx, winner_id)
 
-            winner_db_id = self.db.get_player_id(winner_id)
-            perks = self.db.get_player_perks(winner_db_id)
+            winner_db_id = await self.db.get_player_id(winner_id)
+            perks = await self.db.get_player_perks(winner_db_id)
             taunt = None
             for perk_type, data in perks:
                 if perk_type == 'taunt':
@@ -628,14 +682,14 @@ class Matches(commands.Cog):
             await ctx.send("Invalid result. Use `/r win` or `/r loss`. ")
             return
 
-        match_details = self.db.get_match_details(ctx.author.id)
+        match_details = await self.db.get_match_details(ctx.author.id)
         if not match_details or match_details[0] is None:
             await ctx.send("You are not in an active match.")
             return
 
         opponent, GameModeID = match_details
 
-        match_id = self.db.get_active_match(ctx.author.id)
+        match_id = await self.db.get_active_match(ctx.author.id)
         if not match_id:
             await ctx.send("No active match found.")
             return
@@ -647,14 +701,13 @@ class Matches(commands.Cog):
             winner_id = opponent
             loser_id = ctx.author.id
 
-        winner_rating_before = self.db.get_player_rating(winner_id, GameModeID)
-        loser_rating_before = self.db.get_player_rating(loser_id, GameModeID)
+        winner_rating_before = await self.db.get_player_rating(winner_id, GameModeID)
+        loser_rating_before = await self.db.get_player_rating(loser_id, GameModeID)
 
         new_winner_rating, new_loser_rating = update_elo(winner_rating_before, loser_rating_before)
-        self.db.update_player_rating(winner_id, GameModeID, new_winner_rating)
-        self.db.update_player_rating(loser_id, GameModeID, new_loser_rating)
 
-        self.db.record_match_result(
+        settlement = await self.db.finish_match(
+            match_id,
             winner_id,
             loser_id,
             GameModeID,
@@ -664,15 +717,12 @@ class Matches(commands.Cog):
             new_loser_rating
         )
 
-        self.db.resolve_bets(match_id, winner_id)
-        self.db.remove_match(winner_id, loser_id)
-
-        await self.bot.get_cog('Leaderboard').update_leaderboard(GameModeID)
+        self.bot.dispatch("ratings_changed", GameModeID)
 
         await self.assign_role_based_on_wins(ctx, winner_id)
 
-        winner_db_id = self.db.get_player_id(winner_id)
-        perks = self.db.get_player_perks(winner_db_id)
+        winner_db_id = await self.db.get_player_id(winner_id)
+        perks = await self.db.get_player_perks(winner_db_id)
         taunt = None
         for perk_type, data in perks:
             if perk_type == 'taunt':
@@ -681,6 +731,8 @@ class Matches(commands.Cog):
         response = f"Match result recorded: <@{winner_id}> wins in {self.reverse_mode_map.get(GameModeID, 'Unknown Mode')} mode!\n"
         response += f"Rating change:\n<@{winner_id}>, {new_winner_rating} (+{new_winner_rating - winner_rating_before}) \n"
         response += f"<@{loser_id}>, {new_loser_rating} ({new_loser_rating - loser_rating_before})"
+        if settlement.bets:
+            response += f"\n💰 {settlement.bets} bet(s) settled, {settlement.paid_out} tokens paid out."
 
         if taunt:
             response += f"\n\n**{ctx.guild.get_member(winner_id).display_name} says:** {taunt}"
@@ -690,19 +742,7 @@ class Matches(commands.Cog):
     @commands.command(aliases=["m", "M"])
     async def matches(self, ctx):
         try:
-            self.db.cursor.execute("""
-                SELECT 
-                    m.id,
-                    m.player1 as player1_id,
-                    m.player2 as player2_id,
-                    g.name as mode_name,
-                    m.thread_id
-                FROM matches m
-                JOIN gamemode g ON m.GameModeID = g.id
-                WHERE EXISTS (SELECT 1 FROM players p WHERE p.discord_id = m.player1)
-                AND EXISTS (SELECT 1 FROM players p WHERE p.discord_id = m.player2)
-            """)
-            matches = self.db.cursor.fetchall()
+            matches = await self.db.get_active_matches()
             print(f"Corrected joined matches: {matches}")  # Debug
 
             if not matches:
@@ -710,10 +750,12 @@ class Matches(commands.Cog):
                 return
 
             response = ["**Currently Active Matches:**"]
+            users = await resolve_users(self.bot, [player_id for match in matches for player_id in match[1:3]],
+                                        ctx.guild)
             for match_id, player1_id, player2_id, mode_name, thread_id in matches:
                 try:
-                    player1 = await self.bot.fetch_user(int(player1_id))
-                    player2 = await self.bot.fetch_user(int(player2_id))
+                    player1 = users[int(player1_id)]
+                    player2 = users[int(player2_id)]
 
                     thread_info = ""
                     if thread_id:
@@ -796,7 +838,7 @@ class Matches(commands.Cog):
     async def assign_reward_role(self, member, role_id):
         role = member.guild.get_role(role_id)
         if role:
-            await member.add_roles(role)
+            await self.bot.outbound.call(BOARD, ("roles", member.guild.id), member.add_roles, role)
             return True
         return False
 
@@ -806,19 +848,17 @@ class Matches(commands.Cog):
             print("no member found")
             return
 
-        reward_name, role_id, roles_to_remove_ids = self.db.check_win_reward(user_id)
+        reward_name, role_id, roles_to_remove_ids = await self.db.check_win_reward(user_id)
 
         if roles_to_remove_ids:
             for role_to_remove_id in roles_to_remove_ids:
                 role = member.guild.get_role(role_to_remove_id)
                 if role and role in member.roles:
-                    await member.remove_roles(role)
-                    self.db.cursor.execute("DELETE FROM user_rewards WHERE user_id = ? AND role_id = ?",
-                                           (self.db.get_player_id(user_id), role_to_remove_id))
-                    self.db.conn.commit()
+                    await self.bot.outbound.call(BOARD, ("roles", member.guild.id), member.remove_roles, role)
+                    await self.db.remove_reward(await self.db.get_player_id(user_id), role_to_remove_id)
 
         if role_id:
-            self.db.assign_reward(self.db.get_player_id(user_id), reward_name, role_id)
+            await self.db.assign_reward(await self.db.get_player_id(user_id), reward_name, role_id)
             success = await self.assign_reward_role(member, role_id)
             if success:
                 await ctx.send(f"{member.mention} has been promoted to **{reward_name}**!")
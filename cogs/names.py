@@ -0,0 +1,40 @@
+from discord.ext import commands
+
+
+class Names(commands.Cog):
+    # Feeds the bot's NameDirectory from the gateway so name lookups never
+    # need a REST call once the member list has been received.
+    def __init__(self, bot):
+        self.bot = bot
+        self.names = bot.names
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        for guild in self.bot.guilds:
+            if not guild.chunked:
+                await guild.chunk()
+            self.names.remember_all(guild.members)
+        print(f"Name directory holds {len(self.names)} players.")
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self.names.remember(member)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        self.names.remember(after)
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before, after):
+        # A username change only shows when the member has no nickname, so
+        # the guild member is preferred when there is one.
+        for guild in self.bot.guilds:
+            member = guild.get_member(after.id)
+            if member is not None:
+                self.names.remember(member)
+                return
+        self.names.remember(after)
+
+
+async def setup(bot):
+    await bot.add_cog(Names(bot))
@@ -1,20 +1,51 @@
+import asyncio
+import hashlib
+import json
+
 import discord
-from discord.ext import commands, tasks
-from database import Database
+from discord.ext import commands
 from utils.config import QUEUE_STATUS_CHANNEL_ID
 from utils.maps import REVERSE_MODE_MAP
+from utils.users import resolve_users
 
 class QueueStatus(commands.Cog):
+    # Seconds to wait after a queue change before redrawing, so a burst of
+    # joins, leaves and matches results in a single edit.
+    DEBOUNCE = 2.0
+
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
         self.reverse_mode_map = REVERSE_MODE_MAP
-        self.update_queue_status_message.start()
+        self.rendered_hash = None
+        self._dirty = False
+        self._update_task = None
 
     def cog_unload(self):
-        self.update_queue_status_message.cancel()
+        if self._update_task:
+            self._update_task.cancel()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.schedule_update()
+
+    @commands.Cog.listener()
+    async def on_queue_changed(self, GameModeID):
+        self.schedule_update()
+
+    def schedule_update(self):
+        self._dirty = True
+        if self._update_task is None or self._update_task.done():
+            self._update_task = asyncio.create_task(self._update_later())
+
+    async def _update_later(self):
+        # Changes that arrive while the board is being redrawn trigger one
+        # more pass.
+        while self._dirty:
+            await asyncio.sleep(self.DEBOUNCE)
+            self._dirty = False
+            await self.update_queue_status_message()
 
-    @tasks.loop(seconds=15)
     async def update_queue_status_message(self):
         channel = self.bot.get_channel(QUEUE_STATUS_CHANNEL_ID)
         if not channel:
@@ -22,33 +53,30 @@ class QueueStatus(commands.Cog):
 
         embed = discord.Embed(title="Current Queue Status", color=discord.Color.blue())
 
+        queues = {game_mode_id: self.bot.queue.players(game_mode_id) for game_mode_id in self.reverse_mode_map}
+        users = await resolve_users(self.bot, [player_id for players in queues.values() for player_id in players],
+                                    channel.guild)
+
         for game_mode_id, mode_name in self.reverse_mode_map.items():
-            queue_players = self.db.get_queue_players(game_mode_id)
             player_names = []
-            for player_id in queue_players:
-                try:
-                    user = await self.bot.fetch_user(player_id[0])
-                    player_names.append(user.display_name)
-                except discord.NotFound:
-                    player_names.append(f"Player {player_id[0]}")
-            
+            for player_id in queues[game_mode_id]:
+                user = users.get(player_id)
+                player_names.append(user.display_name if user else f"Player {player_id}")
+
             if player_names:
                 embed.add_field(name=f"{mode_name.capitalize()} ({len(player_names)})", value="\n".join(player_names), inline=False)
             else:
                 embed.add_field(name=f"{mode_name.capitalize()} (0)", value="No players in queue", inline=False)
 
+        rendered_hash = hashlib.sha256(json.dumps(embed.to_dict(), sort_keys=True).encode()).hexdigest()
+        if rendered_hash == self.rendered_hash:
+            return
+
         try:
-            async for message in channel.history(limit=1):
-                if message.author == self.bot.user:
-                    await message.edit(embed=embed)
-                    return
-            await channel.send(embed=embed)
+            await self.bot.boards.edit_or_send(channel, "queue_status", embed=embed)
+            self.rendered_hash = rendered_hash
         except Exception as e:
             print(f"Error updating queue status message: {e}")
 
-    @update_queue_status_message.before_loop
-    async def before_update_queue_status_message(self):
-        await self.bot.wait_until_ready()
-
 async def setup(bot):
     await bot.add_cog(QueueStatus(bot))
@@ -1,12 +1,11 @@
 import discord
 from discord.ext import commands
-from database import Database
 import datetime
 
 class Shop(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
 
     @commands.command(name="shop", description="Spend your tokens on perks.")
     async def shop(self, ctx):
@@ -29,25 +28,16 @@ class Shop(commands.Cog):
             await ctx.send("Please enter a positive amount of tokens to give.")
             return
 
-        sender_id = self.db.get_player_id(sender.id)
+        sender_id = await self.db.get_player_id(sender.id)
         if not sender_id:
             await ctx.send("You are not registered as a player yet. Play a match first!")
             return
 
-        sender_balance = self.db.get_player_balance(sender_id)
-        if sender_balance < amount:
+        transferred, sender_balance = await self.db.transfer_tokens(sender_id, recipient.id, amount)
+        if not transferred:
             await ctx.send(f"You do not have enough tokens to give. You have {sender_balance}, but you tried to give {amount}.")
             return
 
-        recipient_id = self.db.get_player_id(recipient.id)
-        if not recipient_id:
-            self.db.add_player(recipient.id)
-            recipient_id = self.db.get_player_id(recipient.id)
-
-        self.db.update_player_balance(sender_id, sender_balance - amount)
-        recipient_balance = self.db.get_player_balance(recipient_id)
-        self.db.update_player_balance(recipient_id, recipient_balance + amount)
-
         await ctx.send(f"{sender.mention} has successfully given {amount} tokens to {recipient.mention}!")
 
     @give.error
@@ -86,20 +76,17 @@ class PerkSelect(discord.ui.Select):
             await interaction.response.send_modal(TauntModal(self.db, self.user))
 
     async def purchase_highlight(self, interaction: discord.Interaction):
-        player_id = self.db.get_player_id(self.user.id)
+        player_id = await self.db.get_player_id(self.user.id)
         if not player_id:
             await interaction.response.send_message("You are not registered as a player yet. Play a match first!", ephemeral=True)
             return
 
-        balance = self.db.get_player_balance(player_id)
         price = 50
+        expires_at = datetime.datetime.now() + datetime.timedelta(days=7)
+        purchased, balance = await self.db.purchase_perk(player_id, price, "highlight", expires_at=expires_at.isoformat())
 
-        if balance >= price:
-            self.db.update_player_balance(player_id, balance - price)
-            expires_at = datetime.datetime.now() + datetime.timedelta(days=7)
-            self.db.cursor.execute("DELETE FROM player_perks WHERE player_id = ? AND perk_type = 'highlight'", (player_id,))
-            self.db.cursor.execute("INSERT INTO player_perks (player_id, perk_type, expires_at) VALUES (?, ?, ?)", (player_id, "highlight", expires_at.isoformat()))
-            self.db.conn.commit()
+        if purchased:
+            interaction.client.dispatch("perks_changed")
             await interaction.response.send_message("You have purchased a Leaderboard Highlight! It will expire in 7 days.", ephemeral=True)
         else:
             await interaction.response.send_message(f"You do not have enough tokens to purchase this perk. You need {price}, but you have {balance}.", ephemeral=True)
@@ -113,19 +100,15 @@ class TauntModal(discord.ui.Modal, title="Set Your Custom Taunt"):
         self.add_item(self.taunt_input)
 
     async def on_submit(self, interaction: discord.Interaction):
-        player_id = self.db.get_player_id(self.user.id)
+        player_id = await self.db.get_player_id(self.user.id)
         if not player_id:
             await interaction.response.send_message("You are not registered as a player yet. Play a match first!", ephemeral=True)
             return
 
-        balance = self.db.get_player_balance(player_id)
         price = 100
+        purchased, balance = await self.db.purchase_perk(player_id, price, "taunt", data=self.taunt_input.value)
 
-        if balance >= price:
-            self.db.update_player_balance(player_id, balance - price)
-            self.db.cursor.execute("DELETE FROM player_perks WHERE player_id = ? AND perk_type = 'taunt'", (player_id,))
-            self.db.cursor.execute("INSERT INTO player_perks (player_id, perk_type, data) VALUES (?, ?, ?)", (player_id, "taunt", self.taunt_input.value))
-            self.db.conn.commit()
+        if purchased:
             await interaction.response.send_message("Your custom taunt has been set!", ephemeral=True)
         else:
             await interaction.response.send_message(f"You do not have enough tokens to purchase this perk. You need {price}, but you have {balance}.", ephemeral=True)
@@ -1,16 +1,17 @@
 
 import discord
 from discord.ext import commands
-from database import Database
+
+from utils.users import resolve_users
 
 class TokenLeaderboard(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.db = Database()
+        self.db = bot.db
 
     @commands.command(aliases=["tb", "tokenboard"])
     async def token_leaderboard(self, ctx):
-        leaderboard_data = self.db.get_token_leaderboard()
+        leaderboard_data = await self.db.get_token_leaderboard()
 
         if not leaderboard_data:
             await ctx.send("The token leaderboard is currently empty.")
@@ -18,11 +19,12 @@ class TokenLeaderboard(commands.Cog):
 
         embed = discord.Embed(title="Token Leaderboard", color=discord.Color.gold())
         
+        users = await resolve_users(self.bot, [discord_id for discord_id, _ in leaderboard_data], ctx.guild)
         for rank, (discord_id, tokens) in enumerate(leaderboard_data, start=1):
-            try:
-                user = await self.bot.fetch_user(discord_id)
+            user = users.get(discord_id)
+            if user is not None:
                 embed.add_field(name=f"#{rank} {user.name}", value=f"{tokens} tokens", inline=False)
-            except discord.NotFound:
+            else:
                 embed.add_field(name=f"#{rank} Unknown User ({discord_id})", value=f"{tokens} tokens", inline=False)
 
         await ctx.send(embed=embed)
@@ -1,12 +1,181 @@
+import asyncio
+import functools
+import hashlib
+import heapq
+import os
 import sqlite3
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
+from urllib.request import pathname2url
+
+import numpy as np
+
+from logic import rate_match, update_elo
+from migrations import MIGRATIONS
+from rating_replay import replay
+from utils.identity_map import IdentityMap
+from utils.rating_index import RatingIndex
+
+BetSettlement = namedtuple("BetSettlement", "match_id bets bettors staked paid_out refunded")
+
+# Tables moved into the season archives by Database.archive_old_rows, with the
+# column holding each row's timestamp and the rows that are safe to move.
+ARCHIVED_TABLES = {
+    "logs": ("timestamp", "1"),
+    "match_history": ("datetime", "1"),
+    "bets": ("placed_at", "resolved = TRUE"),
+}
+
+
+def season_of(timestamp):
+    # Seasons are calendar quarters: returns the season name and the
+    # [start, end) timestamp range it covers.
+    year, month = int(timestamp[:4]), int(timestamp[5:7])
+    quarter = (month - 1) // 3 + 1
+    start = f"{year:04d}-{quarter * 3 - 2:02d}-01"
+    end = f"{year + 1:04d}-01-01" if quarter == 4 else f"{year:04d}-{quarter * 3 + 1:02d}-01"
+    return f"{year}Q{quarter}", start, end
+
+
+def threaded(method):
+    # Public Database methods that write are awaitable and run on the
+    # database thread. Called from the database thread itself (e.g. inside a
+    # transaction), they run synchronously so they can be composed into one
+    # unit of work.
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self._thread_state, "is_db_thread", False):
+            return method(self, *args, **kwargs)
+        if getattr(self._thread_state, "cursor", None) is not None:
+            raise RuntimeError(f"{method.__name__} writes and cannot run on a read-only connection")
+        return self.run(method, self, *args, **kwargs)
+
+    return wrapper
+
+
+def reader(method):
+    # SELECT-only methods run on the pool of read-only connections. Called
+    # from the database thread they run synchronously on the writer's
+    # connection, so they see the surrounding transaction's own writes.
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self._thread_state, "cursor", None) is not None:
+            return method(self, *args, **kwargs)
+        return self.run_read(method, self, *args, **kwargs)
+
+    return wrapper
 
 
 class Database:
-    def __init__(self, db_path="ladder.db"):
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+    LOG_BATCH_SIZE = 100
+    LOG_FLUSH_INTERVAL = 5.0
+    BACKUP_PAGES = 256
+    BACKUP_STEP_DELAY = 0.005
+    BACKUP_MAX_RESTARTS = 3
+    READ_CONNECTIONS = 4
+
+    def __init__(self, db_path="ladder.db", archive_dir=None, backup_dir=None):
+        self.db_path = db_path
+        self.archive_dir = archive_dir or os.path.join(os.path.dirname(db_path) or ".", "archive")
+        self.backup_dir = backup_dir or os.path.join(os.path.dirname(db_path) or ".", "backups")
+        self.identity_map = IdentityMap()
+        self.ratings = RatingIndex()
+        self.perk_version = 0
+        self.faction_stats = {}
+        self._rating_versions = defaultdict(int)
+        self._leaderboards = {}
+        self._thread_state = threading.local()
+        self._tx_depth = 0
+        self._after_commit = []
+        self._pending_logs = []
+        self._log_lock = threading.Lock()
+        self._log_timer = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ladder-db",
+                                            initializer=self._mark_db_thread)
+        self._executor.submit(self._connect, db_path).result()
+        self._read_connections = []
+        self._read_lock = threading.Lock()
+        self._readers = ThreadPoolExecutor(max_workers=self.READ_CONNECTIONS, thread_name_prefix="ladder-db-read",
+                                           initializer=self._open_reader)
+
+    @property
+    def cursor(self):
+        # The writer's cursor on the database thread, a read-only
+        # connection's cursor on the reader threads.
+        return self._thread_state.cursor
+
+    def _mark_db_thread(self):
+        self._thread_state.is_db_thread = True
+
+    def _connect(self, db_path):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, uri=True)
+        self._thread_state.cursor = self.conn.cursor()
+        self._enable_incremental_vacuum()
+        self.cursor.execute("PRAGMA journal_mode = WAL")
+        self.cursor.execute("PRAGMA synchronous = NORMAL")
         self._create_tables()
+        self._migrate()
+        self._load_ratings()
+        self._load_faction_stats()
+
+    def _open_reader(self):
+        conn = sqlite3.connect(self._read_only_uri(self.db_path), check_same_thread=False, uri=True)
+        with self._read_lock:
+            self._read_connections.append(conn)
+        self._thread_state.cursor = conn.cursor()
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def run_read(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, functools.partial(fn, *args, **kwargs))
+
+    async def close(self):
+        with self._log_lock:
+            if self._log_timer:
+                self._log_timer.cancel()
+                self._log_timer = None
+        self._readers.shutdown(wait=True)
+        with self._read_lock:
+            for conn in self._read_connections:
+                conn.close()
+            self._read_connections.clear()
+        await self.run(self._flush_logs)
+        await self.run(self.conn.close)
+        self._executor.shutdown(wait=True)
+
+    @contextmanager
+    def transaction(self):
+        # Nested transactions join the outermost one, which commits (or rolls
+        # back) everything at once. In-memory state is updated through
+        # on_commit so it never reflects a rolled back write.
+        self._tx_depth += 1
+        try:
+            yield self.cursor
+        except BaseException:
+            self._tx_depth -= 1
+            if self._tx_depth == 0:
+                self.conn.rollback()
+                self._after_commit.clear()
+            raise
+        self._tx_depth -= 1
+        if self._tx_depth == 0:
+            self.conn.commit()
+            callbacks, self._after_commit = self._after_commit, []
+            for callback in callbacks:
+                callback()
+
+    def on_commit(self, callback):
+        if self._tx_depth:
+            self._after_commit.append(callback)
+        else:
+            callback()
 
     def _create_tables(self):
         self.cursor.executescript("""
@@ -160,77 +329,205 @@ class Database:
                 FOREIGN KEY (player_id) REFERENCES players(id) ON DELETE CASCADE
             );
         """)
-            
 
+    def _enable_incremental_vacuum(self):
+        # auto_vacuum only changes through a full VACUUM, so an existing
+        # database pays for it once.
+        if self.cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            self.cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.cursor.execute("VACUUM")
+
+    def _migrate(self):
+        version = self.cursor.execute("PRAGMA user_version").fetchone()[0]
+        for target, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            if callable(script):
+                with self.transaction():
+                    script(self.cursor)
+                    self.cursor.execute(f"PRAGMA user_version = {target}")
+            else:
+                self.cursor.executescript(f"BEGIN; {script}; PRAGMA user_version = {target}; COMMIT;")
+            print(f"Database migrated to schema version {target}.")
+
+    def _load_ratings(self):
+        self.cursor.execute("""
+            SELECT p.discord_id, pr.GameModeID, pr.elo, pr.matches, pr.wins
+            FROM player_ratings pr
+            JOIN players p ON pr.player_id = p.id
+        """)
+        self.ratings.load(self.cursor.fetchall())
+
+    def _refresh_ratings(self, GameModeID, *player_ids):
+        # Re-reads the given rating rows inside the current transaction and
+        # pushes them into the in-memory rating index once it commits.
+        placeholders = ", ".join("?" * len(player_ids))
+        self.cursor.execute(f"""
+            SELECT p.discord_id, pr.elo, pr.matches, pr.wins
+            FROM player_ratings pr
+            JOIN players p ON pr.player_id = p.id
+            WHERE pr.GameModeID = ? AND pr.player_id IN ({placeholders})
+        """, (GameModeID, *player_ids))
+        rows = self.cursor.fetchall()
+
+        def apply():
+            for discord_id, elo, matches, wins in rows:
+                self.ratings.update(discord_id, GameModeID, elo, matches, wins)
+            self._rating_versions[GameModeID] += 1
+
+        self.on_commit(apply)
+
+    def _write_rating_events(self, *match_ids):
+        # Rewrites the rating_events rows of the given matches from
+        # match_history; reverted matches lose theirs.
+        params = [(match_id,) for match_id in match_ids]
+        self.cursor.executemany("DELETE FROM rating_events WHERE seq = ?", params)
+        self.cursor.executemany("""
+            INSERT INTO rating_events (player_id, GameModeID, seq, opponent_id, won, elo_before, elo_after, datetime)
+            SELECT winner, GameModeID, id, CASE WHEN winner = player1 THEN player2 ELSE player1 END, TRUE,
+                   elo_before_winner, elo_after_winner, datetime
+            FROM match_history WHERE id = ?1 AND reverted = FALSE
+            UNION ALL
+            SELECT CASE WHEN winner = player1 THEN player2 ELSE player1 END, GameModeID, id, winner, FALSE,
+                   elo_before_loser, elo_after_loser, datetime
+            FROM match_history WHERE id = ?1 AND reverted = FALSE
+        """, params)
+
+    def _load_faction_stats(self):
+        self.cursor.execute("SELECT faction_name, wins, losses FROM faction_stats")
+        self.faction_stats = {faction_name: (wins, losses) for faction_name, wins, losses in self.cursor.fetchall()}
+
+    def _count_faction_result(self, faction_name, won):
+        # Runs on the database thread while the event loop may be iterating
+        # faction_stats, so a new dict is published instead of mutating the
+        # current one.
+        stats = dict(self.faction_stats)
+        wins, losses = stats.get(faction_name, (0, 0))
+        stats[faction_name] = (wins + 1, losses) if won else (wins, losses + 1)
+        self.faction_stats = stats
+
+    @threaded
     def update_faction_stats(self, faction_name, won):
-        if won:
-            self.cursor.execute("INSERT INTO faction_stats (faction_name, wins) VALUES (?, 1) ON CONFLICT(faction_name) DO UPDATE SET wins = wins + 1", (faction_name,))
-        else:
-            self.cursor.execute("INSERT INTO faction_stats (faction_name, losses) VALUES (?, 1) ON CONFLICT(faction_name) DO UPDATE SET losses = losses + 1", (faction_name,))
-        self.conn.commit()
+        with self.transaction():
+            if won:
+                self.cursor.execute("INSERT INTO faction_stats (faction_name, wins) VALUES (?, 1) ON CONFLICT(faction_name) DO UPDATE SET wins = wins + 1", (faction_name,))
+            else:
+                self.cursor.execute("INSERT INTO faction_stats (faction_name, losses) VALUES (?, 1) ON CONFLICT(faction_name) DO UPDATE SET losses = losses + 1", (faction_name,))
+            self.on_commit(functools.partial(self._count_faction_result, faction_name, won))
 
+    @threaded
     def update_player_faction_stats(self, player_id, faction_name, won):
-        db_player_id = self.get_player_id(player_id)
-        if won:
-            self.cursor.execute("INSERT INTO player_faction_stats (player_id, faction_name, wins) VALUES (?, ?, 1) ON CONFLICT(player_id, faction_name) DO UPDATE SET wins = wins + 1", (db_player_id, faction_name))
-        else:
-            self.cursor.execute("INSERT INTO player_faction_stats (player_id, faction_name, losses) VALUES (?, ?, 1) ON CONFLICT(player_id, faction_name) DO UPDATE SET losses = losses + 1", (db_player_id, faction_name))
-        self.conn.commit()
+        with self.transaction():
+            db_player_id = self.get_player_id(player_id)
+            if won:
+                self.cursor.execute("INSERT INTO player_faction_stats (player_id, faction_name, wins) VALUES (?, ?, 1) ON CONFLICT(player_id, faction_name) DO UPDATE SET wins = wins + 1", (db_player_id, faction_name))
+            else:
+                self.cursor.execute("INSERT INTO player_faction_stats (player_id, faction_name, losses) VALUES (?, ?, 1) ON CONFLICT(player_id, faction_name) DO UPDATE SET losses = losses + 1", (db_player_id, faction_name))
 
+    @reader
     def get_faction_stats(self):
         self.cursor.execute("SELECT faction_name, wins, losses FROM faction_stats")
         return self.cursor.fetchall()
 
+    @reader
     def get_player_faction_stats(self, player_id):
         db_player_id = self.get_player_id(player_id)
         self.cursor.execute("SELECT faction_name, wins, losses FROM player_faction_stats WHERE player_id = ?", (db_player_id,))
         return self.cursor.fetchall()
 
+    @threaded
     def log_event(self, command, user_id, user_name):
-        now = datetime.now().isoformat()
-        self.cursor.execute("""
-            INSERT INTO logs (timestamp, command, user_id, user_name)
-            VALUES (?, ?, ?, ?)
-        """, (now, command, user_id, user_name))
-        self.conn.commit()
-
+        # Log lines are buffered and written in batches, either once
+        # LOG_BATCH_SIZE lines are pending or LOG_FLUSH_INTERVAL seconds after
+        # the first one. Lines logged inside a transaction are only buffered
+        # if it commits.
+        entry = (datetime.now().isoformat(), command, user_id, user_name)
+        self.on_commit(lambda: self._buffer_log(entry))
+
+    def _buffer_log(self, entry):
+        with self._log_lock:
+            self._pending_logs.append(entry)
+            if len(self._pending_logs) >= self.LOG_BATCH_SIZE:
+                if self._log_timer:
+                    self._log_timer.cancel()
+                    self._log_timer = None
+                self._executor.submit(self._flush_logs)
+            elif self._log_timer is None:
+                self._log_timer = threading.Timer(self.LOG_FLUSH_INTERVAL, self._schedule_log_flush)
+                self._log_timer.daemon = True
+                self._log_timer.start()
+
+    def _schedule_log_flush(self):
+        with self._log_lock:
+            self._log_timer = None
+        try:
+            self._executor.submit(self._flush_logs)
+        except RuntimeError:
+            pass
+
+    def _flush_logs(self):
+        with self._log_lock:
+            entries, self._pending_logs = self._pending_logs, []
+        if not entries:
+            return
+
+        try:
+            with self.transaction():
+                self.cursor.executemany("""
+                    INSERT INTO logs (timestamp, command, user_id, user_name)
+                    VALUES (?, ?, ?, ?)
+                """, entries)
+        except sqlite3.Error as e:
+            print(f"Error writing {len(entries)} log entries: {e}")
+
+    @threaded
     def add_player(self, discord_id):
         now = datetime.now().isoformat()
-        self.cursor.execute("""
-            INSERT INTO players (discord_id, created_at, updated_at) 
-            VALUES (?, ?, ?)
-            ON CONFLICT(discord_id) DO UPDATE SET updated_at = ?
-        """, (discord_id, now, now, now))
-        self.conn.commit()
-
-    def add_player_mode(self, discord_id, GameModeID):
-        self.cursor.execute("SELECT id FROM players WHERE discord_id = ?", (discord_id,))
-        player = self.cursor.fetchone()
 
-        if player:
-            player_id = player[0]
+        with self.transaction():
             self.cursor.execute("""
-                INSERT OR IGNORE INTO player_ratings (player_id, GameModeID, elo, matches, wins)
-                VALUES (?, ?, 1000, 0, 0)
-            """, (player_id, GameModeID))
-            self.conn.commit()
+                INSERT INTO players (discord_id, created_at, updated_at) 
+                VALUES (?, ?, ?)
+                ON CONFLICT(discord_id) DO UPDATE SET updated_at = ?
+            """, (discord_id, now, now, now))
+
+            if self.identity_map.get_player_id(discord_id) is None:
+                self.cursor.execute("SELECT id FROM players WHERE discord_id = ?", (discord_id,))
+                player_id = self.cursor.fetchone()[0]
+                self.on_commit(lambda: self.identity_map.add(discord_id, player_id))
 
+    @threaded
+    def add_player_mode(self, discord_id, GameModeID):
+        with self.transaction():
+            player_id = self.get_player_id(discord_id)
+
+            if player_id:
+                self.cursor.execute("""
+                    INSERT OR IGNORE INTO player_ratings (player_id, GameModeID, elo, matches, wins)
+                    VALUES (?, ?, 1000, 0, 0)
+                """, (player_id, GameModeID))
+                if self.cursor.rowcount:
+                    self._refresh_ratings(GameModeID, player_id)
+
+    @reader
     def get_elo(self, discord_id, GameModeID):
         self.cursor.execute("""
             SELECT elo FROM player_ratings 
-            WHERE player_id = (SELECT id FROM players WHERE discord_id = ?) AND GameModeID = ?
-        """, (discord_id, GameModeID))
+            WHERE player_id = ? AND GameModeID = ?
+        """, (self.get_player_id(discord_id), GameModeID))
         result = self.cursor.fetchone()
         return result[0] if result else 1000
 
+    @threaded
     def update_elo(self, discord_id, GameModeID, new_elo):
-        self.cursor.execute("""
-            UPDATE player_ratings 
-            SET elo = ?
-            WHERE player_id = (SELECT id FROM players WHERE discord_id = ?) AND GameModeID = ?
-        """, (new_elo, discord_id, GameModeID))
-        self.conn.commit()
+        with self.transaction():
+            player_id = self.get_player_id(discord_id)
+            self.cursor.execute("""
+                UPDATE player_ratings 
+                SET elo = ?
+                WHERE player_id = ? AND GameModeID = ?
+            """, (new_elo, player_id, GameModeID))
+            self._refresh_ratings(GameModeID, player_id)
 
+    @reader
     def get_queue_players(self, GameModeID):
         self.cursor.execute("""
             SELECT discord_id FROM queue 
@@ -238,6 +535,7 @@ class Database:
         """, (GameModeID,))
         return self.cursor.fetchall()
 
+    @reader
     def get_queue_players_count(self, GameModeID):
         self.cursor.execute("""
             SELECT COUNT(*) FROM queue 
@@ -245,71 +543,99 @@ class Database:
         """, (GameModeID,))
         return self.cursor.fetchone()[0]
 
-    def add_to_queue(self, discord_id, GameModeID):
-        now = datetime.now().isoformat()
-        self.cursor.execute("""
-            INSERT INTO queue (discord_id, GameModeID, timestamp_queued, created_at, updated_at, is_unqueued)
-            VALUES (?, ?, ?, ?, ?, FALSE)
-            ON CONFLICT(discord_id, GameModeID) DO UPDATE SET
-                is_unqueued = FALSE,
-                timestamp_queued = excluded.timestamp_queued,
-                updated_at = excluded.updated_at
-        """, (discord_id, GameModeID, now, now, now))
-        self.conn.commit()
-
-        self.cursor.execute("SELECT discord_id FROM players WHERE discord_id = ?", (discord_id,))
-        user = self.cursor.fetchone()
-        if user:
-            user_name = user[0]
-            self.log_event("add_to_queue", discord_id, user_name)
+    @threaded
+    def add_to_queue(self, discord_id, GameModeID, queued_at=None):
+        now = queued_at or datetime.now().isoformat()
 
+        with self.transaction():
+            self.cursor.execute("""
+                INSERT INTO queue (discord_id, GameModeID, timestamp_queued, created_at, updated_at, is_unqueued)
+                VALUES (?, ?, ?, ?, ?, FALSE)
+                ON CONFLICT(discord_id, GameModeID) DO UPDATE SET
+                    is_unqueued = FALSE,
+                    timestamp_queued = excluded.timestamp_queued,
+                    updated_at = excluded.updated_at
+            """, (discord_id, GameModeID, now, now, now))
+
+            self.log_event("add_to_queue", discord_id, discord_id)
+
+    @threaded
     def remove_from_all_queues(self, discord_id):
-        self.cursor.execute("DELETE FROM queue WHERE discord_id = ?", (discord_id,))
-        self.conn.commit()
+        with self.transaction():
+            self.cursor.execute("DELETE FROM queue WHERE discord_id = ?", (discord_id,))
 
+    @threaded
     def remove_from_queue(self, discord_id, GameModeID):
-        self.cursor.execute("DELETE FROM queue WHERE discord_id = ? AND GameModeID = ?", (discord_id, GameModeID))
-        self.conn.commit()
+        with self.transaction():
+            self.cursor.execute("DELETE FROM queue WHERE discord_id = ? AND GameModeID = ?", (discord_id, GameModeID))
 
-    def mark_as_unqueued(self, discord_id, GameModeID):
-        now = datetime.now().isoformat()
-        self.cursor.execute("""
-            UPDATE queue 
-            SET is_unqueued = TRUE, timestamp_unqueued = ?
-            WHERE discord_id = ? AND GameModeID = ?
-        """, (now, discord_id, GameModeID))
-        self.conn.commit()
-
-        self.cursor.execute("SELECT discord_id FROM players WHERE discord_id = ?", (discord_id,))
-        user = self.cursor.fetchone()
-        if user:
-            user_name = user[0]
-            self.log_event("mark_as_unqueued", discord_id, user_name)
+    @threaded
+    def mark_as_unqueued(self, discord_id, GameModeID, unqueued_at=None):
+        now = unqueued_at or datetime.now().isoformat()
 
+        with self.transaction():
+            self.cursor.execute("""
+                UPDATE queue 
+                SET is_unqueued = TRUE, timestamp_unqueued = ?
+                WHERE discord_id = ? AND GameModeID = ?
+            """, (now, discord_id, GameModeID))
+
+            self.log_event("mark_as_unqueued", discord_id, discord_id)
+
+    @threaded
+    def apply_queue_changes(self, changes):
+        # Write-behind batch from MatchQueue, applied in order in one
+        # transaction.
+        with self.transaction():
+            for change, discord_id, GameModeID, timestamp in changes:
+                if change == "add":
+                    self.add_to_queue(discord_id, GameModeID, queued_at=timestamp)
+                elif change == "leave":
+                    self.mark_as_unqueued(discord_id, GameModeID, unqueued_at=timestamp)
+                elif GameModeID is None:
+                    self.remove_from_all_queues(discord_id)
+                else:
+                    self.remove_from_queue(discord_id, GameModeID)
+
+    @threaded
+    def replace_queue(self, entries):
+        # Makes the waiting rows match MatchQueue's entries exactly, e.g.
+        # after a restore brought back the queue of the snapshot.
+        with self.transaction():
+            self.cursor.execute("DELETE FROM queue WHERE is_matched = FALSE AND is_unqueued = FALSE")
+            self.cursor.executemany("""
+                INSERT INTO queue (discord_id, GameModeID, timestamp_queued, created_at, updated_at, is_unqueued)
+                VALUES (?1, ?2, ?3, ?3, ?3, FALSE)
+                ON CONFLICT(discord_id, GameModeID) DO UPDATE SET
+                    is_unqueued = FALSE,
+                    timestamp_queued = excluded.timestamp_queued,
+                    updated_at = excluded.updated_at
+            """, [(discord_id, GameModeID, queued_at.isoformat()) for discord_id, GameModeID, queued_at in entries])
+
+    @threaded
     def create_match(self, player1, player2, GameModeID, thread_id, maps):
         now = datetime.now().isoformat()
-        self.cursor.execute("""
-            INSERT INTO matches (player1, player2, GameModeID, thread_id, maps, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (player1, player2, GameModeID, thread_id, ",".join(maps), now, now))
-        self.conn.commit()
-        match_id = self.cursor.lastrowid
-
-        self.cursor.execute("SELECT discord_id FROM players WHERE discord_id = ?", (player1,))
-        user = self.cursor.fetchone()
-        if user:
-            user_name = user[0]
-            self.log_event("create_match", player1, user_name)
-        return match_id
 
+        with self.transaction():
+            self.cursor.execute("""
+                INSERT INTO matches (player1, player2, GameModeID, thread_id, maps, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (player1, player2, GameModeID, thread_id, ",".join(maps), now, now))
+            match_id = self.cursor.lastrowid
+
+            self.log_event("create_match", player1, player1)
+            return match_id
+
+    @threaded
     def update_match_message_id(self, match_id, message_id):
-        self.cursor.execute("""
-            UPDATE matches 
-            SET message_id = ?
-            WHERE id = ?
-        """, (message_id, match_id))
-        self.conn.commit()
+        with self.transaction():
+            self.cursor.execute("""
+                UPDATE matches 
+                SET message_id = ?
+                WHERE id = ?
+            """, (message_id, match_id))
 
+    @reader
     def get_match_message_id(self, match_id):
         self.cursor.execute("""
             SELECT message_id 
@@ -319,60 +645,58 @@ class Database:
         result = self.cursor.fetchone()
         return result[0] if result else None
 
+    @threaded
     def remove_match(self, player1_id, player2_id):
-        self.cursor.execute("""
-            DELETE FROM matches 
-            WHERE (player1 = ? AND player2 = ?) 
-               OR (player1 = ? AND player2 = ?)
-        """, (player1_id, player2_id, player2_id, player1_id))
-        self.conn.commit()
-
-        self.cursor.execute("SELECT discord_id FROM players WHERE discord_id = ?", (player1_id,))
-        user = self.cursor.fetchone()
-        if user:
-            user_name = user[0]
-            self.log_event("remove_match", player1_id, user_name)
+        with self.transaction():
+            self.cursor.execute("""
+                DELETE FROM matches 
+                WHERE (player1 = ? AND player2 = ?) 
+                   OR (player1 = ? AND player2 = ?)
+            """, (player1_id, player2_id, player2_id, player1_id))
 
+            self.log_event("remove_match", player1_id, player1_id)
+
+    @threaded
     def record_match_result(self, winner_id, loser_id, GameModeID, elo_before_winner, elo_after_winner,
                             elo_before_loser, elo_after_loser, match_id=None):
         now = datetime.now().isoformat()
 
-        self.cursor.execute("SELECT id FROM players WHERE discord_id = ?", (winner_id,))
-        winner_player_id = self.cursor.fetchone()[0]
-
-        self.cursor.execute("SELECT id FROM players WHERE discord_id = ?", (loser_id,))
-        loser_player_id = self.cursor.fetchone()[0]
+        with self.transaction():
+            winner_player_id = self.get_player_id(winner_id)
+            loser_player_id = self.get_player_id(loser_id)
+
+            if match_id:
+                self.cursor.execute("""
+                    UPDATE match_history
+                    SET winner = ?, elo_before_winner = ?, elo_after_winner = ?,
+                        elo_before_loser = ?, elo_after_loser = ?, games = NULL, reverted = FALSE
+                    WHERE id = ?
+                """, (winner_player_id, elo_before_winner, elo_after_winner, elo_before_loser, elo_after_loser, match_id))
+            else:
+                self.cursor.execute("""
+                    INSERT INTO match_history (player1, player2, winner, GameModeID, 
+                                               elo_before_winner, elo_after_winner, 
+                                               elo_before_loser, elo_after_loser, datetime)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (winner_player_id, loser_player_id, winner_player_id, GameModeID, elo_before_winner, elo_after_winner,
+                      elo_before_loser, elo_after_loser, now))
+                match_id = self.cursor.lastrowid
+            self._write_rating_events(match_id)
 
-        if match_id:
             self.cursor.execute("""
-                UPDATE match_history
-                SET winner = ?, elo_before_winner = ?, elo_after_winner = ?,
-                    elo_before_loser = ?, elo_after_loser = ?
-                WHERE id = ?
-            """, (winner_player_id, elo_before_winner, elo_after_winner, elo_before_loser, elo_after_loser, match_id))
-        else:
-            self.cursor.execute("""
-                INSERT INTO match_history (player1, player2, winner, GameModeID, 
-                                           elo_before_winner, elo_after_winner, 
-                                           elo_before_loser, elo_after_loser, datetime)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (winner_player_id, loser_player_id, winner_player_id, GameModeID, elo_before_winner, elo_after_winner,
-                  elo_before_loser, elo_after_loser, now))
-
-        self.cursor.execute("""
-            UPDATE player_ratings 
-            SET elo = ?, matches = matches + 1, wins = wins + 1
-            WHERE player_id = ? AND GameModeID = ?
-        """, (elo_after_winner, winner_player_id, GameModeID))
-
-        self.cursor.execute("""
-            UPDATE player_ratings 
-            SET elo = ?, matches = matches + 1
-            WHERE player_id = ? AND GameModeID = ?
-        """, (elo_after_loser, loser_player_id, GameModeID))
+                UPDATE player_ratings 
+                SET elo = ?, matches = matches + 1, wins = wins + 1
+                WHERE player_id = ? AND GameModeID = ?
+            """, (elo_after_winner, winner_player_id, GameModeID))
 
-        self.conn.commit()
+            self.cursor.execute("""
+                UPDATE player_ratings 
+                SET elo = ?, matches = matches + 1
+                WHERE player_id = ? AND GameModeID = ?
+            """, (elo_after_loser, loser_player_id, GameModeID))
+            self._refresh_ratings(GameModeID, winner_player_id, loser_player_id)
 
+    @reader
     def get_queue_status(self, player_id):
         self.cursor.execute("""
             SELECT GameModeID FROM queue 
@@ -381,6 +705,7 @@ class Database:
         results = self.cursor.fetchall()
         return [result[0] for result in results] if results else []
 
+    @reader
     def get_match_details(self, player_id):
         self.cursor.execute("""
             SELECT player1, player2, GameModeID 
@@ -395,23 +720,41 @@ class Database:
             return opponent, GameModeID
         return None, None
 
+    @reader
     def get_player_rating(self, discord_id, GameModeID):
         self.cursor.execute("""
             SELECT elo FROM player_ratings 
-            WHERE player_id = (SELECT id FROM players WHERE discord_id = ?) AND GameModeID = ?
-        """, (discord_id, GameModeID))
+            WHERE player_id = ? AND GameModeID = ?
+        """, (self.get_player_id(discord_id), GameModeID))
         result = self.cursor.fetchone()
         return result[0] if result else "N/A"
 
+    @threaded
     def update_player_rating(self, player_id, GameModeID, rating):
-        self.cursor.execute("""
-            UPDATE player_ratings 
-            SET elo = ?, matches = matches + 1
-            WHERE player_id = ? AND GameModeID = ?
-        """, (rating, player_id, GameModeID))
-        self.conn.commit()
+        with self.transaction():
+            self.cursor.execute("""
+                UPDATE player_ratings 
+                SET elo = ?, matches = matches + 1
+                WHERE player_id = ? AND GameModeID = ?
+            """, (rating, player_id, GameModeID))
+            self._refresh_ratings(GameModeID, player_id)
+
+    def rating_version(self, GameModeID):
+        # Bumped whenever a rating in the mode changes; anything derived from
+        # the leaderboard can be cached against it.
+        return self._rating_versions[GameModeID]
+
+    async def get_leaderboard(self, GameModeID, limit=10):
+        version = self.rating_version(GameModeID)
+        cached = self._leaderboards.get(GameModeID)
+        if cached and cached[0] == version and cached[1] >= limit:
+            return cached[2][:limit]
+
+        results = await self.run_read(self._fetch_leaderboard, GameModeID, limit)
+        self._leaderboards[GameModeID] = (version, limit, results)
+        return results
 
-    def get_leaderboard(self, GameModeID, limit=10):
+    def _fetch_leaderboard(self, GameModeID, limit):
         self.cursor.execute("""
             SELECT p.discord_id, pr.elo, pr.matches, pr.wins 
             FROM player_ratings pr
@@ -423,25 +766,58 @@ class Database:
         results = self.cursor.fetchall()
         return results
 
-    def get_match_history(self, discord_id, limit=11):
+    @reader
+    def get_match_history(self, discord_id, limit=11, include_archived=False):
+        player_id = self.get_player_id(discord_id)
         self.cursor.execute("""
+            SELECT e.opponent_id, e.won, e.GameModeID, e.elo_before, e.elo_after, o.elo_before, o.elo_after
+            FROM rating_events e
+            JOIN rating_events o ON o.player_id = e.opponent_id AND o.GameModeID = e.GameModeID AND o.seq = e.seq
+            WHERE e.player_id = ?
+            ORDER BY e.seq DESC
+            LIMIT ?
+        """, (player_id, limit))
+        rows = []
+        for opponent_id, won, GameModeID, elo_before, elo_after, opponent_before, opponent_after in self.cursor.fetchall():
+            if won:
+                rows.append((player_id, opponent_id, player_id, GameModeID,
+                             elo_before, elo_after, opponent_before, opponent_after))
+            else:
+                rows.append((opponent_id, player_id, opponent_id, GameModeID,
+                             opponent_before, opponent_after, elo_before, elo_after))
+
+        # Archived seasons only keep match_history, reverted matches included.
+        query = """
             SELECT 
-                (SELECT discord_id FROM players WHERE id = player1) AS player1_discord_id,
-                (SELECT discord_id FROM players WHERE id = player2) AS player2_discord_id,
-                (SELECT discord_id FROM players WHERE id = winner) AS winner_discord_id,
+                player1,
+                player2,
+                winner,
                 GameModeID, 
                 elo_before_winner, 
                 elo_after_winner,
                 elo_before_loser,
                 elo_after_loser
-            FROM match_history
-            WHERE player1 = (SELECT id FROM players WHERE discord_id = ?) 
-               OR player2 = (SELECT id FROM players WHERE discord_id = ?)
+            FROM archive.match_history
+            WHERE (player1 = ? 
+               OR player2 = ?)
+              AND reverted = FALSE
             ORDER BY id DESC
             LIMIT ?
-        """, (discord_id, discord_id, limit))
-        return self.cursor.fetchall()
+        """
+        if include_archived:
+            for path in self._archive_paths():
+                if len(rows) >= limit:
+                    break
+                with self._attach_archive(path):
+                    self.cursor.execute(query, (player_id, player_id, limit - len(rows)))
+                    rows += self.cursor.fetchall()
+
+        return [
+            (self.get_discord_id(player1), self.get_discord_id(player2), self.get_discord_id(winner), *rest)
+            for player1, player2, winner, *rest in rows
+        ]
 
+    @reader
     def get_queue_statistics(self):
         self.cursor.execute("""
             SELECT strftime('%Y-%m-%d %H:%M:%S', timestamp_queued) AS timestamp, 
@@ -457,37 +833,80 @@ class Database:
 
         return results
 
-    def get_player_elo_history(self, discord_id, GameModeID):
+    @reader
+    def get_player_elo_history(self, discord_id, GameModeID, include_archived=False):
         if not GameModeID:
             return []
 
-        self.cursor.execute("""
+        player_id = self.get_player_id(discord_id)
+        # Archived seasons only keep match_history, reverted matches included.
+        query = """
             SELECT replace(substr(datetime, 1, 19), 'T', ' ') AS timestamp, 
                    CASE 
-                       WHEN winner = (SELECT id FROM players WHERE discord_id = ?) THEN elo_after_winner
+                       WHEN winner = ? THEN elo_after_winner
                        ELSE elo_after_loser
                    END AS elo
-            FROM match_history
-            WHERE (player1 = (SELECT id FROM players WHERE discord_id = ?) 
-               OR player2 = (SELECT id FROM players WHERE discord_id = ?))
+            FROM archive.match_history
+            WHERE (player1 = ? 
+               OR player2 = ?)
               AND GameModeID = ?
+              AND reverted = FALSE
             ORDER BY timestamp ASC
-        """, (discord_id, discord_id, discord_id, GameModeID))
+        """
+        params = (player_id, player_id, player_id, GameModeID)
+        results = []
+        if include_archived:
+            for path in reversed(self._archive_paths()):
+                with self._attach_archive(path):
+                    self.cursor.execute(query, params)
+                    results += self.cursor.fetchall()
 
-        results = self.cursor.fetchall()
+        self.cursor.execute("""
+            SELECT replace(substr(datetime, 1, 19), 'T', ' ') AS timestamp, elo_after
+            FROM rating_events
+            WHERE player_id = ? AND GameModeID = ?
+            ORDER BY seq
+        """, (player_id, GameModeID))
+        results += self.cursor.fetchall()
 
         return results
 
+    @reader
     def get_player_id(self, discord_id):
+        player_id = self.identity_map.get_player_id(discord_id)
+        if player_id is not None:
+            return player_id
+
         self.cursor.execute("SELECT id FROM players WHERE discord_id = ?", (discord_id,))
         result = self.cursor.fetchone()
-        return result[0] if result else None
+        if not result:
+            return None
+        self._remember_identity(discord_id, result[0])
+        return result[0]
 
+    @reader
     def get_discord_id(self, player_id):
+        discord_id = self.identity_map.get_discord_id(player_id)
+        if discord_id is not None:
+            return discord_id
+
         self.cursor.execute("SELECT discord_id FROM players WHERE id = ?", (player_id,))
         result = self.cursor.fetchone()
-        return result[0] if result else None
+        if not result:
+            return None
+        self._remember_identity(result[0], player_id)
+        return result[0]
 
+    def _remember_identity(self, discord_id, player_id):
+        # On the database thread the row may have been inserted by the open
+        # transaction, so it is only cached once that commits. Read-only
+        # connections only ever see committed rows.
+        if getattr(self._thread_state, "is_db_thread", False):
+            self.on_commit(functools.partial(self.identity_map.add, discord_id, player_id))
+        else:
+            self.identity_map.add(discord_id, player_id)
+
+    @reader
     def get_player_balance(self, user_id):
         print(user_id)
         self.cursor.execute("SELECT tokens FROM players WHERE id = ?", (user_id,))
@@ -498,55 +917,86 @@ class Database:
 
         return result[0]
 
+    @threaded
     def update_player_balance(self, user_id, new_balance):
         now = datetime.now().isoformat()
-        self.cursor.execute("""
-            UPDATE players 
-            SET tokens = ?, updated_at = ?
-            WHERE id = ?
-        """, (new_balance, now, user_id))
-        self.conn.commit()
 
+        with self.transaction():
+            self.cursor.execute("""
+                UPDATE players 
+                SET tokens = ?, updated_at = ?
+                WHERE id = ?
+            """, (new_balance, now, user_id))
+
+    @threaded
     def place_bet(self, bettor_id, match_id, bet_side, amount):
         now = datetime.now().isoformat()
-        player_id = self.get_player_id(bettor_id)
 
-        balance = self.get_player_balance(player_id)
-        if balance < amount:
-            raise ValueError("Insufficient balance to place the bet.")
+        with self.transaction():
+            player_id = self.get_player_id(bettor_id)
 
-        new_balance = balance - amount
-        self.update_player_balance(player_id, new_balance)
+            balance = self.get_player_balance(player_id)
+            if balance < amount:
+                raise ValueError("Insufficient balance to place the bet.")
 
-        self.cursor.execute("""
-            INSERT INTO bets (match_id, bettor_id, bet_side, amount, placed_at, resolved)
-            VALUES (?, ?, ?, ?, ?, FALSE)
-        """, (match_id, bettor_id, bet_side, amount, now))
-        self.conn.commit()
+            new_balance = balance - amount
+            self.update_player_balance(player_id, new_balance)
 
-    def resolve_bets(self, match_id, winner_id):
-        self.cursor.execute("SELECT bettor_id, bet_side, amount FROM bets WHERE match_id = ? AND resolved = FALSE",
-                            (match_id,))
-        bets = self.cursor.fetchall()
+            self.cursor.execute("""
+                INSERT INTO bets (match_id, bettor_id, bet_side, amount, placed_at, resolved)
+                VALUES (?, ?, ?, ?, ?, FALSE)
+            """, (match_id, bettor_id, bet_side, amount, now))
 
-        for bettor_id, bet_side, amount in bets:
-            if bet_side == winner_id:
-                winnings = amount * 2
-                try:
-                    new_balance = self.get_player_balance(self.get_player_id(bettor_id)) + winnings
-                    self.update_player_balance(self.get_player_id(bettor_id), new_balance)
-                except ValueError as e:
-                    print(f"Error resolving bet for bettor {bettor_id}: {str(e)}")
+    @threaded
+    def resolve_bets(self, match_id, winner_id):
+        return self.settle_bets(match_id, winner_id)
 
-        self.cursor.execute("UPDATE bets SET resolved = TRUE WHERE match_id = ?", (match_id,))
-        self.conn.commit()
+    @threaded
+    def settle_bets(self, match_id, winner_id=None):
+        # Pays every unresolved bet on the match in one aggregated UPDATE:
+        # bets on winner_id return double the stake, and without a winner
+        # (abandoned match) every stake is refunded.
+        now = datetime.now().isoformat()
+        multiplier = 1 if winner_id is None else 2
 
+        with self.transaction():
+            self.cursor.execute("""
+                SELECT COUNT(*), COUNT(DISTINCT bettor_id), COALESCE(SUM(amount), 0),
+                       COALESCE(SUM(CASE WHEN ? IS NULL OR bet_side = ? THEN amount END), 0)
+                FROM bets
+                WHERE match_id = ? AND resolved = FALSE
+            """, (winner_id, winner_id, match_id))
+            bets, bettors, staked, paying = self.cursor.fetchone()
+
+            if paying:
+                self.cursor.execute("""
+                    UPDATE players
+                    SET tokens = tokens + ? * (
+                            SELECT SUM(b.amount) FROM bets b
+                            WHERE b.match_id = ? AND b.resolved = FALSE
+                              AND b.bettor_id = players.discord_id
+                              AND (? IS NULL OR b.bet_side = ?)
+                        ),
+                        updated_at = ?
+                    WHERE discord_id IN (
+                        SELECT bettor_id FROM bets
+                        WHERE match_id = ? AND resolved = FALSE AND (? IS NULL OR bet_side = ?)
+                    )
+                """, (multiplier, match_id, winner_id, winner_id, now, match_id, winner_id, winner_id))
+
+            self.cursor.execute("UPDATE bets SET resolved = TRUE WHERE match_id = ? AND resolved = FALSE", (match_id,))
+
+        return BetSettlement(match_id, bets, bettors, staked, paying * multiplier, winner_id is None)
+
+    @reader
     def check_win_reward(self, discord_id):
         user_id = self.get_player_id(discord_id)
         if not user_id:
             return None, None, None
 
-        self.cursor.execute("SELECT COUNT(*) FROM match_history WHERE winner = ?", (user_id,))
+        # player_ratings keeps the win counts of archived seasons, which
+        # match_history loses once old rows are archived.
+        self.cursor.execute("SELECT COALESCE(SUM(wins), 0) FROM player_ratings WHERE player_id = ?", (user_id,))
         wins = self.cursor.fetchone()[0]
 
         roles = [
@@ -584,38 +1034,44 @@ class Database:
 
         return None, None, None
 
+    @threaded
     def assign_reward(self, user_id, reward_name, role_id, expires_at=None):
         now = datetime.now().isoformat()
-        self.cursor.execute("""
-            INSERT INTO user_rewards (user_id, reward_name, role_id, awarded_at, expires_at)
-            VALUES (?, ?, ?, ?, ?)
-        """, (user_id, reward_name, role_id, now, expires_at))
-        self.conn.commit()
-        return role_id
 
+        with self.transaction():
+            self.cursor.execute("""
+                INSERT INTO user_rewards (user_id, reward_name, role_id, awarded_at, expires_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (user_id, reward_name, role_id, now, expires_at))
+            return role_id
+
+    @reader
     def get_active_match(self, player_id):
         self.cursor.execute("SELECT id FROM matches WHERE player1 = ? OR player2 = ?", (player_id, player_id))
         result = self.cursor.fetchone()
 
         return result[0] if result else None
 
+    @threaded
     def remove_expired_rewards(self):
         now = datetime.now().isoformat()
-        self.cursor.execute("""
-            SELECT user_id, role_id 
-            FROM user_rewards 
-            WHERE expires_at IS NOT NULL AND expires_at < ?
-        """, (now,))
-        expired_rewards = self.cursor.fetchall()
 
-        self.cursor.execute("""
-            DELETE FROM user_rewards 
-            WHERE expires_at IS NOT NULL AND expires_at < ?
-        """, (now,))
-        self.conn.commit()
+        with self.transaction():
+            self.cursor.execute("""
+                SELECT user_id, role_id 
+                FROM user_rewards 
+                WHERE expires_at IS NOT NULL AND expires_at < ?
+            """, (now,))
+            expired_rewards = self.cursor.fetchall()
+
+            self.cursor.execute("""
+                DELETE FROM user_rewards 
+                WHERE expires_at IS NOT NULL AND expires_at < ?
+            """, (now,))
 
-        return expired_rewards
+            return expired_rewards
 
+    @reader
     def get_current_matches(self):
         self.cursor.execute("""
             SELECT 
@@ -630,6 +1086,7 @@ class Database:
         """)
         return self.cursor.fetchall()
 
+    @reader
     def get_match_thread(self, player1, player2, GameModeID):
         self.cursor.execute("""
             SELECT thread_id FROM matches 
@@ -638,49 +1095,29 @@ class Database:
         result = self.cursor.fetchone()
         return result[0] if result else None
 
-    def get_winrate(self, discord_id, GameModeID):
-        player_id = self.get_player_id(discord_id)
-        self.cursor.execute(
-            "SELECT wins, matches FROM player_ratings WHERE player_id = ? AND GameModeID = ?",
-            (player_id, GameModeID),
-        )
-        result = self.cursor.fetchone()
-
-        if result:
-            wins, matches = result
-            wins = wins if wins is not None else 0
-            matches = matches if matches is not None else 0
-
-            return round((wins / matches) * 100, 1) if matches > 0 else 0
-        return 0
-
-    def get_player_rank(self, discord_id, GameModeID):
-        player_id = self.get_player_id(discord_id)
-        self.cursor.execute(
-            "SELECT elo FROM player_ratings WHERE player_id = ? AND GameModeID = ?",
-            (player_id, GameModeID),
-        )
-        result = self.cursor.fetchone()
-        if not result:
-            return None, None
-
-        player_elo = result[0]
-
-        self.cursor.execute(
-            "SELECT COUNT(*) FROM player_ratings WHERE GameModeID = ? AND elo > ?",
-            (GameModeID, player_elo),
-        )
-        higher_rank_count = self.cursor.fetchone()[0]
-
-        self.cursor.execute(
-            "SELECT COUNT(*) FROM player_ratings WHERE GameModeID = ?",
-            (GameModeID,),
-        )
-        total_players = self.cursor.fetchone()[0]
-
-        player_rank = higher_rank_count + 1
-        return player_rank, total_players
+    async def get_winrate(self, discord_id, GameModeID):
+        entry = self.ratings.get(discord_id, GameModeID)
+        if entry is None:
+            return 0
+        _, matches, wins = entry
+        return round((wins / matches) * 100, 1) if matches > 0 else 0
+
+    async def get_player_rank(self, discord_id, GameModeID):
+        return self.ratings.rank(discord_id, GameModeID)
+
+    async def get_player_standing(self, discord_id, GameModeID):
+        # Rating, win rate, rank, total and top percentile straight from the
+        # in-memory rating index; None if the player has no rating in the mode.
+        entry = self.ratings.get(discord_id, GameModeID)
+        if entry is None:
+            return None
+        elo, matches, wins = entry
+        win_rate = round((wins / matches) * 100, 1) if matches > 0 else 0
+        player_rank, total_players = self.ratings.rank(discord_id, GameModeID)
+        top_percentile = round((player_rank / total_players) * 100, 1) if total_players else 100
+        return elo, win_rate, player_rank, total_players, top_percentile
 
+    @reader
     def get_opponent_id(self, bettor_id: int, match_id: int):
         self.cursor.execute("SELECT player1, player2 FROM matches WHERE id = ?", (match_id,))
         match = self.cursor.fetchone()
@@ -696,34 +1133,54 @@ class Database:
         else:
             return None
 
+    @reader
     def get_player_perks(self, player_id):
         now = datetime.now().isoformat()
-        self.cursor.execute("DELETE FROM player_perks WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
-        self.conn.commit()
-
-        self.cursor.execute("SELECT perk_type, data FROM player_perks WHERE player_id = ?", (player_id,))
+        self.cursor.execute("""
+            SELECT perk_type, data FROM player_perks
+            WHERE player_id = ? AND (expires_at IS NULL OR expires_at >= ?)
+        """, (player_id, now))
         return self.cursor.fetchall()
 
+    @reader
+    def get_highlighted_players(self, discord_ids):
+        # Discord IDs among discord_ids with an active highlight perk.
+        discord_ids = list(discord_ids)
+        if not discord_ids:
+            return set()
+        now = datetime.now().isoformat()
+        self.cursor.execute(f"""
+            SELECT DISTINCT p.discord_id FROM player_perks pp
+            JOIN players p ON p.id = pp.player_id
+            WHERE pp.perk_type = 'highlight' AND (pp.expires_at IS NULL OR pp.expires_at >= ?)
+            AND p.discord_id IN ({",".join("?" * len(discord_ids))})
+        """, (now, *discord_ids))
+        return {row[0] for row in self.cursor.fetchall()}
+
+    @threaded
     def create_luckydice_match(self, match_id, player1_id, player2_id, player1_pool, player2_pool):
-        self.cursor.execute("""
-            INSERT INTO luckydice_selections (match_id, player1_id, player2_id, player1_faction_pool, player2_faction_pool)
-            VALUES (?, ?, ?, ?, ?)
-        """, (match_id, player1_id, player2_id, ",".join(player1_pool), ",".join(player2_pool)))
-        self.conn.commit()
+        with self.transaction():
+            self.cursor.execute("""
+                INSERT INTO luckydice_selections (match_id, player1_id, player2_id, player1_faction_pool, player2_faction_pool)
+                VALUES (?, ?, ?, ?, ?)
+            """, (match_id, player1_id, player2_id, ",".join(player1_pool), ",".join(player2_pool)))
 
+    @reader
     def get_luckydice_selections(self, match_id):
         self.cursor.execute("SELECT * FROM luckydice_selections WHERE match_id = ?", (match_id,))
         return self.cursor.fetchone()
 
+    @threaded
     def update_luckydice_selection(self, match_id, player_id, selected_factions):
-        selections = self.get_luckydice_selections(match_id)
-        if selections:
-            if selections[1] == player_id:
-                self.cursor.execute("UPDATE luckydice_selections SET player1_selected_factions = ?, player1_ready = TRUE WHERE match_id = ?", (",".join(selected_factions), match_id))
-            else:
-                self.cursor.execute("UPDATE luckydice_selections SET player2_selected_factions = ?, player2_ready = TRUE WHERE match_id = ?", (",".join(selected_factions), match_id))
-            self.conn.commit()
-
+        with self.transaction():
+            selections = self.get_luckydice_selections(match_id)
+            if selections:
+                if selections[1] == player_id:
+                    self.cursor.execute("UPDATE luckydice_selections SET player1_selected_factions = ?, player1_ready = TRUE WHERE match_id = ?", (",".join(selected_factions), match_id))
+                else:
+                    self.cursor.execute("UPDATE luckydice_selections SET player2_selected_factions = ?, player2_ready = TRUE WHERE match_id = ?", (",".join(selected_factions), match_id))
+
+    @reader
     def get_token_leaderboard(self, limit=15):
         self.cursor.execute("""
             SELECT p.discord_id, p.tokens
@@ -733,6 +1190,7 @@ class Database:
         """, (limit,))
         return self.cursor.fetchall()
 
+    @reader
     def get_all_queued_players(self):
         self.cursor.execute("""
             SELECT q.discord_id, q.GameModeID, q.timestamp_queued, g.name 
@@ -742,46 +1200,686 @@ class Database:
         """)
         return self.cursor.fetchall()
 
+    @reader
+    def get_player_names(self):
+        self.cursor.execute("SELECT discord_id, name, display_name FROM player_names")
+        return self.cursor.fetchall()
+
+    @threaded
+    def save_player_names(self, names):
+        # names: (discord_id, name, display_name, updated_at) rows from
+        # NameDirectory.
+        with self.transaction():
+            self.cursor.executemany("""
+                INSERT INTO player_names (discord_id, name, display_name, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (discord_id) DO UPDATE SET
+                    name = excluded.name, display_name = excluded.display_name, updated_at = excluded.updated_at
+            """, names)
+
+    @reader
+    def get_board_messages(self):
+        self.cursor.execute("""
+            SELECT purpose, GameModeID, channel_id, message_id FROM board_messages
+            ORDER BY purpose, GameModeID, channel_id, position
+        """)
+        return self.cursor.fetchall()
+
+    @threaded
+    def replace_board_messages(self, rows):
+        # rows: (purpose, GameModeID, channel_id, position, message_id)
+        with self.transaction():
+            self.cursor.execute("DELETE FROM board_messages")
+            self.cursor.executemany("""
+                INSERT INTO board_messages (purpose, GameModeID, channel_id, position, message_id)
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+
+    @threaded
+    def set_board_messages(self, purpose, GameModeID, channel_id, message_ids):
+        with self.transaction():
+            self.cursor.execute("""
+                DELETE FROM board_messages WHERE purpose = ? AND GameModeID = ? AND channel_id = ?
+            """, (purpose, GameModeID, channel_id))
+            self.cursor.executemany("""
+                INSERT INTO board_messages (purpose, GameModeID, channel_id, position, message_id)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(purpose, GameModeID, channel_id, position, message_id)
+                  for position, message_id in enumerate(message_ids)])
+
+    @reader
     def get_match_maps(self, match_id):
         self.cursor.execute("SELECT maps FROM matches WHERE id = ?", (match_id,))
         result = self.cursor.fetchone()
         return result[0].split(',') if result and result[0] else []
 
+    @threaded
     def update_player_wins(self, player_id, GameModeID, number_of_wins):
-        db_player_id = self.get_player_id(player_id)
-        if db_player_id:
+        with self.transaction():
+            db_player_id = self.get_player_id(player_id)
+            if db_player_id:
+                self.cursor.execute("""
+                    UPDATE player_ratings 
+                    SET wins = wins + ?
+                    WHERE player_id = ? AND GameModeID = ?
+                """, (number_of_wins, db_player_id, GameModeID))
+                self._refresh_ratings(GameModeID, db_player_id)
+
+    @threaded
+    def record_luckydice_match(self, winner_id, loser_id, GameModeID, elo_before_winner, elo_after_winner,
+                               elo_before_loser, elo_after_loser, games=None):
+        now = datetime.now().isoformat()
+
+        with self.transaction():
+            winner_player_id = self.get_player_id(winner_id)
+            loser_player_id = self.get_player_id(loser_id)
+
+            self.cursor.execute("""
+                INSERT INTO match_history (player1, player2, winner, GameModeID, 
+                                           elo_before_winner, elo_after_winner, 
+                                           elo_before_loser, elo_after_loser, datetime, games)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (winner_player_id, loser_player_id, winner_player_id, GameModeID, elo_before_winner, elo_after_winner,
+                  elo_before_loser, elo_after_loser, now, games))
+            self._write_rating_events(self.cursor.lastrowid)
+
             self.cursor.execute("""
                 UPDATE player_ratings 
-                SET wins = wins + ?
+                SET elo = ?, matches = matches + 1, wins = wins + 1
                 WHERE player_id = ? AND GameModeID = ?
-            """, (number_of_wins, db_player_id, GameModeID))
-            self.conn.commit()
+            """, (elo_after_winner, winner_player_id, GameModeID))
 
-    def record_luckydice_match(self, winner_id, loser_id, GameModeID, elo_before_winner, elo_after_winner,
-                               elo_before_loser, elo_after_loser):
+            self.cursor.execute("""
+                UPDATE player_ratings 
+                SET elo = ?, matches = matches + 1
+                WHERE player_id = ? AND GameModeID = ?
+            """, (elo_after_loser, loser_player_id, GameModeID))
+            self._refresh_ratings(GameModeID, winner_player_id, loser_player_id)
+
+    @threaded
+    def refund_bets(self, match_id):
+        return self.settle_bets(match_id)
+
+    @reader
+    def has_bet(self, bettor_id, match_id):
+        self.cursor.execute("SELECT id FROM bets WHERE bettor_id = ? AND match_id = ?", (bettor_id, match_id))
+        return self.cursor.fetchone() is not None
+
+    @reader
+    def get_bet_history(self, player_id):
+        self.cursor.execute("""
+            SELECT b.match_id, b.bet_side, b.amount, b.placed_at, b.resolved, p.discord_id 
+            FROM bets b
+            INNER JOIN players p ON b.bet_side = p.id
+            WHERE b.bettor_id = ?
+        """, (player_id,))
+        return self.cursor.fetchall()
+
+    @reader
+    def get_active_matches(self):
+        self.cursor.execute("""
+            SELECT 
+                m.id,
+                m.player1 as player1_id,
+                m.player2 as player2_id,
+                g.name as mode_name,
+                m.thread_id
+            FROM matches m
+            JOIN gamemode g ON m.GameModeID = g.id
+            WHERE EXISTS (SELECT 1 FROM players p WHERE p.discord_id = m.player1)
+            AND EXISTS (SELECT 1 FROM players p WHERE p.discord_id = m.player2)
+        """)
+        return self.cursor.fetchall()
+
+    @threaded
+    def set_player_perk(self, player_id, perk_type, data=None, expires_at=None):
         now = datetime.now().isoformat()
 
-        winner_player_id = self.get_player_id(winner_id)
-        loser_player_id = self.get_player_id(loser_id)
+        with self.transaction():
+            self.cursor.execute("DELETE FROM player_perks WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+            self.cursor.execute("DELETE FROM player_perks WHERE player_id = ? AND perk_type = ?", (player_id, perk_type))
+            self.cursor.execute("INSERT INTO player_perks (player_id, perk_type, data, expires_at) VALUES (?, ?, ?, ?)",
+                                (player_id, perk_type, data, expires_at))
+            self.on_commit(self._bump_perk_version)
+
+    def _bump_perk_version(self):
+        self.perk_version += 1
 
+    @threaded
+    def remove_reward(self, user_id, role_id):
+        with self.transaction():
+            self.cursor.execute("DELETE FROM user_rewards WHERE user_id = ? AND role_id = ?", (user_id, role_id))
+
+    @reader
+    def get_match_history_entry(self, match_id):
         self.cursor.execute("""
-            INSERT INTO match_history (player1, player2, winner, GameModeID, 
-                                       elo_before_winner, elo_after_winner, 
-                                       elo_before_loser, elo_after_loser, datetime)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (winner_player_id, loser_player_id, winner_player_id, GameModeID, elo_before_winner, elo_after_winner,
-              elo_before_loser, elo_after_loser, now))
+            SELECT player1, player2, winner, GameModeID, 
+                   elo_before_winner, elo_after_winner,
+                   elo_before_loser, elo_after_loser
+            FROM match_history
+            WHERE id = ?
+        """, (match_id,))
+        return self.cursor.fetchone()
+
+    @threaded
+    def revert_match(self, match_id):
+        with self.transaction():
+            self.cursor.execute("""
+                SELECT player1, player2, winner, GameModeID, 
+                       elo_before_winner, elo_after_winner,
+                       elo_before_loser, elo_after_loser
+                FROM match_history
+                WHERE id = ? AND reverted = FALSE
+            """, (match_id,))
+            match = self.cursor.fetchone()
+            if not match:
+                return None
+
+            player1, player2, winner, GameModeID, elo_before_winner, elo_after_winner, elo_before_loser, elo_after_loser = match
+            loser = player2 if winner == player1 else player1
+
+            self.cursor.execute("""
+                UPDATE player_ratings 
+                SET matches = matches - 1, wins = wins - 1
+                WHERE player_id = ? AND GameModeID = ?
+            """, (winner, GameModeID))
 
+            self.cursor.execute("""
+                UPDATE player_ratings 
+                SET matches = matches - 1
+                WHERE player_id = ? AND GameModeID = ?
+            """, (loser, GameModeID))
+
+            self.cursor.execute("UPDATE match_history SET reverted = TRUE WHERE id = ?", (match_id,))
+            self._write_rating_events(match_id)
+            self._cascade_ratings(GameModeID, match_id, {winner: elo_before_winner, loser: elo_before_loser})
+
+            self.cursor.execute("DELETE FROM bets WHERE match_id = ?", (match_id,))
+            return match
+
+    @reader
+    def get_recent_matches(self, limit=10):
         self.cursor.execute("""
-            UPDATE player_ratings 
-            SET elo = ?, matches = matches + 1, wins = wins + 1
-            WHERE player_id = ? AND GameModeID = ?
-        """, (elo_after_winner, winner_player_id, GameModeID))
+            SELECT mh.id, 
+                   mh.player1,
+                   mh.player2,
+                   mh.winner,
+                   g.name as mode,
+                   mh.datetime
+            FROM match_history mh
+            JOIN gamemode g ON mh.GameModeID = g.id
+            ORDER BY mh.id DESC
+            LIMIT ?
+        """, (limit,))
+        return [
+            (match_id, self.get_discord_id(player1), self.get_discord_id(player2), self.get_discord_id(winner), *rest)
+            for match_id, player1, player2, winner, *rest in self.cursor.fetchall()
+        ]
+
+    @threaded
+    def purchase_perk(self, player_id, price, perk_type, data=None, expires_at=None):
+        with self.transaction():
+            balance = self.get_player_balance(player_id)
+            if balance < price:
+                return False, balance
+            self.update_player_balance(player_id, balance - price)
+            self.set_player_perk(player_id, perk_type, data=data, expires_at=expires_at)
+            return True, balance - price
+
+    @threaded
+    def transfer_tokens(self, sender_id, recipient_discord_id, amount):
+        with self.transaction():
+            sender_balance = self.get_player_balance(sender_id)
+            if sender_balance < amount:
+                return False, sender_balance
+
+            self.add_player(recipient_discord_id)
+            recipient_id = self.get_player_id(recipient_discord_id)
+            self.update_player_balance(sender_id, sender_balance - amount)
+            self.update_player_balance(recipient_id, self.get_player_balance(recipient_id) + amount)
+            return True, sender_balance - amount
+
+    @threaded
+    def finish_match(self, match_id, winner_id, loser_id, GameModeID, elo_before_winner, elo_after_winner,
+                     elo_before_loser, elo_after_loser, faction_results=None):
+        with self.transaction():
+            if faction_results is None:
+                self.record_match_result(winner_id, loser_id, GameModeID, elo_before_winner, elo_after_winner,
+                                         elo_before_loser, elo_after_loser)
+            else:
+                for game_winner_id, winner_faction, game_loser_id, loser_faction in faction_results:
+                    self.update_faction_stats(winner_faction, True)
+                    self.update_faction_stats(loser_faction, False)
+                    self.update_player_faction_stats(game_winner_id, winner_faction, True)
+                    self.update_player_faction_stats(game_loser_id, loser_faction, False)
+                games = "".join("1" if result[0] == winner_id else "0" for result in faction_results)
+                self.record_luckydice_match(winner_id, loser_id, GameModeID, elo_before_winner, elo_after_winner,
+                                            elo_before_loser, elo_after_loser, games=games)
+
+            settlement = self.resolve_bets(match_id, winner_id)
+            self.remove_match(winner_id, loser_id)
+            return settlement
+
+    @threaded
+    def edit_match_result(self, match_id, new_winner_id):
+        # Re-rates the match from the ratings both players had when it was
+        # played, then carries the change forward through their later matches.
+        with self.transaction():
+            self.cursor.execute("""
+                SELECT player1, player2, winner, GameModeID, elo_before_winner, elo_before_loser, reverted
+                FROM match_history
+                WHERE id = ?
+            """, (match_id,))
+            match = self.cursor.fetchone()
+            if not match:
+                return None
+
+            player1, player2, winner, GameModeID, elo_before_winner, elo_before_loser, reverted = match
+            new_winner = self.get_player_id(new_winner_id)
+            if new_winner not in (player1, player2):
+                return None
+            new_loser = player2 if new_winner == player1 else player1
+
+            before = {winner: elo_before_winner, (player2 if winner == player1 else player1): elo_before_loser}
+            new_winner_rating, new_loser_rating = update_elo(before[new_winner], before[new_loser])
 
+            self.cursor.execute("""
+                UPDATE match_history
+                SET winner = ?, elo_before_winner = ?, elo_after_winner = ?,
+                    elo_before_loser = ?, elo_after_loser = ?, games = NULL, reverted = FALSE
+                WHERE id = ?
+            """, (new_winner, before[new_winner], new_winner_rating, before[new_loser], new_loser_rating, match_id))
+            self._write_rating_events(match_id)
+
+            if reverted:
+                self.cursor.execute("""
+                    UPDATE player_ratings
+                    SET matches = matches + 1, wins = wins + (player_id = ?)
+                    WHERE player_id IN (?, ?) AND GameModeID = ?
+                """, (new_winner, player1, player2, GameModeID))
+            elif new_winner != winner:
+                self.cursor.execute("""
+                    UPDATE player_ratings
+                    SET wins = wins + (CASE WHEN player_id = ? THEN 1 ELSE -1 END)
+                    WHERE player_id IN (?, ?) AND GameModeID = ?
+                """, (new_winner, player1, player2, GameModeID))
+
+            self._cascade_ratings(GameModeID, match_id, {new_winner: new_winner_rating, new_loser: new_loser_rating})
+            return GameModeID
+
+    def _next_match(self, player_id, GameModeID, after_id):
         self.cursor.execute("""
-            UPDATE player_ratings 
-            SET elo = ?, matches = matches + 1
+            SELECT MIN(seq) FROM rating_events
+            WHERE player_id = ? AND GameModeID = ? AND seq > ?
+        """, (player_id, GameModeID, after_id))
+        return self.cursor.fetchone()[0]
+
+    def _cascade_ratings(self, GameModeID, match_id, ratings):
+        # `ratings` holds the corrected rating of each player right after
+        # `match_id`. Walks those players' later matches in order, re-rating
+        # each one from the corrected ratings, until every player is back in
+        # line with what is stored; only rows that change are written. Returns
+        # the number of later matches that changed.
+        dirty = dict(ratings)
+        pending = []
+        for player_id in dirty:
+            next_id = self._next_match(player_id, GameModeID, match_id)
+            if next_id:
+                heapq.heappush(pending, next_id)
+
+        changed = 0
+        last_id = None
+        while pending:
+            current_id = heapq.heappop(pending)
+            if current_id == last_id:
+                continue
+            last_id = current_id
+
+            self.cursor.execute("""
+                SELECT winner, CASE WHEN winner = player1 THEN player2 ELSE player1 END, games,
+                       elo_before_winner, elo_after_winner, elo_before_loser, elo_after_loser
+                FROM match_history
+                WHERE id = ?
+            """, (current_id,))
+            winner, loser, games, *stored = self.cursor.fetchone()
+            before_winner = dirty.get(winner, stored[0])
+            before_loser = dirty.get(loser, stored[2])
+            after_winner, after_loser = rate_match(before_winner, before_loser, games)
+
+            if [before_winner, after_winner, before_loser, after_loser] != stored:
+                changed += 1
+                self.cursor.execute("""
+                    UPDATE match_history
+                    SET elo_before_winner = ?, elo_after_winner = ?, elo_before_loser = ?, elo_after_loser = ?
+                    WHERE id = ?
+                """, (before_winner, after_winner, before_loser, after_loser, current_id))
+                self._write_rating_events(current_id)
+
+            for player_id, after, stored_after in ((winner, after_winner, stored[1]), (loser, after_loser, stored[3])):
+                if after == stored_after:
+                    dirty.pop(player_id, None)
+                    continue
+                dirty[player_id] = after
+                next_id = self._next_match(player_id, GameModeID, current_id)
+                if next_id:
+                    heapq.heappush(pending, next_id)
+
+        # Whoever is still out of line has no later match: the corrected
+        # rating is their current one.
+        self.cursor.executemany("""
+            UPDATE player_ratings
+            SET elo = ?
             WHERE player_id = ? AND GameModeID = ?
-        """, (elo_after_loser, loser_player_id, GameModeID))
+        """, [(elo, player_id, GameModeID) for player_id, elo in dirty.items()])
+        self._refresh_ratings(GameModeID, *ratings, *dirty)
+        return changed
+
+    @threaded
+    def recompute_ratings(self, GameModeID):
+        # Replays every (non reverted) match of the mode in order and rewrites
+        # the stored ratings wherever they differ from the replay. Each player
+        # starts from their rating before their first match still in the hot
+        # database, so archived seasons are not replayed. Returns the number
+        # of matches replayed, history rows changed and players changed.
+        self.cursor.execute("""
+            SELECT id, winner, CASE WHEN winner = player1 THEN player2 ELSE player1 END, games,
+                   elo_before_winner, elo_after_winner, elo_before_loser, elo_after_loser
+            FROM match_history
+            WHERE GameModeID = ? AND reverted = FALSE
+            ORDER BY id
+        """, (GameModeID,))
+        rows = self.cursor.fetchall()
+        if not rows:
+            return 0, 0, 0
+
+        match_ids, winner_ids, loser_ids, games, *stored = zip(*rows)
+        slots = {}
+        seeds = []
+        for winner_id, loser_id, before_winner, before_loser in zip(winner_ids, loser_ids, stored[0], stored[2]):
+            for player_id, before in ((winner_id, before_winner), (loser_id, before_loser)):
+                if player_id not in slots:
+                    slots[player_id] = len(slots)
+                    seeds.append(before)
+
+        winners = np.fromiter((slots[p] for p in winner_ids), dtype=np.int64, count=len(rows))
+        losers = np.fromiter((slots[p] for p in loser_ids), dtype=np.int64, count=len(rows))
+        *replayed, ratings = replay(winners, losers, games, seeds)
+
+        changed = np.zeros(len(rows), dtype=bool)
+        for new, old in zip(replayed, stored):
+            changed |= new != np.array(old, dtype=np.int64)
+        history_updates = [
+            (*(int(column[i]) for column in replayed), match_ids[i])
+            for i in np.flatnonzero(changed).tolist()
+        ]
+
+        player_ids = list(slots)
+        self.cursor.execute("SELECT player_id, elo FROM player_ratings WHERE GameModeID = ?", (GameModeID,))
+        current = dict(self.cursor.fetchall())
+        rating_updates = [
+            (int(elo), player_id, GameModeID)
+            for player_id, elo in zip(player_ids, ratings.tolist())
+            if player_id in current and current[player_id] != elo
+        ]
 
-        self.conn.commit()
\ No newline at end of file
+        with self.transaction():
+            self.cursor.executemany("""
+                UPDATE match_history
+                SET elo_before_winner = ?, elo_after_winner = ?, elo_before_loser = ?, elo_after_loser = ?
+                WHERE id = ?
+            """, history_updates)
+            self._write_rating_events(*(update[-1] for update in history_updates))
+            self.cursor.executemany("""
+                UPDATE player_ratings
+                SET elo = ?
+                WHERE player_id = ? AND GameModeID = ?
+            """, rating_updates)
+            if rating_updates:
+                self._refresh_ratings(GameModeID, *(player_id for _, player_id, _ in rating_updates))
+
+        return len(rows), len(history_updates), len(rating_updates)
+
+    @threaded
+    def check_query_plans(self, discord_id, GameModeID, match_id):
+        # Runs the hot read paths for the given player and match with tracing
+        # enabled and returns every statement whose EXPLAIN QUERY PLAN still
+        # contains a full table scan. The paths run as one transaction that is
+        # always rolled back, so resolve_bets never pays anything out.
+        statements = []
+        self._tx_depth += 1
+        self.conn.set_trace_callback(statements.append)
+        try:
+            self.get_match_history(discord_id)
+            self.get_player_elo_history(discord_id, GameModeID)
+            self.get_match_details(discord_id)
+            self.get_active_match(discord_id)
+            self.get_player_rating(discord_id, GameModeID)
+            self._fetch_leaderboard(GameModeID, 10)
+            self.get_queue_players(GameModeID)
+            self.has_bet(discord_id, match_id)
+            self.check_win_reward(discord_id)
+            self.resolve_bets(match_id, discord_id)
+        finally:
+            self.conn.set_trace_callback(None)
+            self._tx_depth -= 1
+            self.conn.rollback()
+            self._after_commit.clear()
+
+        scans = []
+        for statement in dict.fromkeys(statements):
+            if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                continue
+            plan = self.cursor.execute(f"EXPLAIN QUERY PLAN {statement}").fetchall()
+            details = [row[3] for row in plan if row[3].startswith("SCAN ")]
+            if details:
+                scans.append((" ".join(statement.split()), details))
+        return scans
+
+    def _archive_path(self, season):
+        name = os.path.splitext(os.path.basename(self.db_path))[0]
+        return os.path.join(self.archive_dir, f"{name}-{season}.db")
+
+    def _archive_paths(self):
+        # Newest season first.
+        if not os.path.isdir(self.archive_dir):
+            return []
+        prefix = os.path.splitext(os.path.basename(self.db_path))[0] + "-"
+        return sorted(
+            (os.path.join(self.archive_dir, f) for f in os.listdir(self.archive_dir)
+             if f.startswith(prefix) and f.endswith(".db")),
+            reverse=True
+        )
+
+    @contextmanager
+    def _attach_archive(self, path, readonly=True):
+        if readonly:
+            target = self._read_only_uri(path)
+        else:
+            target = path
+        self.cursor.execute("ATTACH DATABASE ? AS archive", (target,))
+        try:
+            yield
+        finally:
+            self.cursor.execute("DETACH DATABASE archive")
+
+    def _prepare_archive_table(self, table):
+        # Archive tables mirror the hot table's columns; columns added to the
+        # hot table by later migrations are added to older archives as needed.
+        columns = [row[1] for row in self.cursor.execute(f"PRAGMA main.table_info({table})")]
+        self.cursor.execute(f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0")
+        self.cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS archive.idx_{table}_id ON {table} (id)")
+        archived = {row[1] for row in self.cursor.execute(f"PRAGMA archive.table_info({table})")}
+        for column in columns:
+            if column not in archived:
+                self.cursor.execute(f"ALTER TABLE archive.{table} ADD COLUMN {column}")
+        if table == "match_history":
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_match_history_player1 ON match_history (player1, GameModeID)")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_match_history_player2 ON match_history (player2, GameModeID)")
+        return ", ".join(columns)
+
+    @threaded
+    def archive_old_rows(self, before):
+        # Moves rows older than `before` into one archive database per season
+        # and returns the number of rows moved per season.
+        self._flush_logs()
+        cutoff = before.isoformat()
+
+        seasons = {}
+        for table, (column, condition) in ARCHIVED_TABLES.items():
+            start = ""
+            while True:
+                self.cursor.execute(f"""
+                    SELECT MIN({column}) FROM {table}
+                    WHERE {column} >= ? AND {column} < ? AND {condition}
+                """, (start, cutoff))
+                oldest = self.cursor.fetchone()[0]
+                if oldest is None:
+                    break
+                season, start, end = season_of(oldest)
+                seasons[season] = (start, min(end, cutoff))
+                start = end
+
+        moved = {}
+        if not seasons:
+            return moved
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for season, (start, end) in sorted(seasons.items()):
+            moved[season] = 0
+            with self._attach_archive(self._archive_path(season), readonly=False):
+                with self.transaction():
+                    for table, (column, condition) in ARCHIVED_TABLES.items():
+                        columns = self._prepare_archive_table(table)
+                        where = f"{column} >= ? AND {column} < ? AND {condition}"
+                        self.cursor.execute(f"""
+                            INSERT OR IGNORE INTO archive.{table} ({columns})
+                            SELECT {columns} FROM main.{table} WHERE {where}
+                        """, (start, end))
+                        if table == "match_history":
+                            self.cursor.execute(f"""
+                                DELETE FROM main.rating_events
+                                WHERE seq IN (SELECT id FROM main.match_history WHERE {where})
+                            """, (start, end))
+                        self.cursor.execute(f"DELETE FROM main.{table} WHERE {where}", (start, end))
+                        moved[season] += self.cursor.rowcount
+
+        self.cursor.execute("PRAGMA incremental_vacuum").fetchall()
+        return moved
+
+    def _read_only_uri(self, path):
+        return f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+
+    def _backup_paths(self):
+        # Oldest first.
+        if not os.path.isdir(self.backup_dir):
+            return []
+        prefix = os.path.splitext(os.path.basename(self.db_path))[0] + "-"
+        return sorted(
+            os.path.join(self.backup_dir, f) for f in os.listdir(self.backup_dir)
+            if f.startswith(prefix) and f.endswith(".db")
+        )
+
+    def _write_backup(self, path):
+        # Runs on a worker thread with its own read-only connection, copying
+        # BACKUP_PAGES pages per step so writers are only ever held up for one
+        # step. A write from the bot between steps restarts the copy; after
+        # BACKUP_MAX_RESTARTS restarts the rest is copied in a single step.
+        partial = path + ".partial"
+        source = sqlite3.connect(self._read_only_uri(self.db_path), uri=True)
+        try:
+            for pages in (self.BACKUP_PAGES, -1):
+                restarts = 0
+                remaining_before = None
+
+                def progress(status, remaining, total):
+                    nonlocal restarts, remaining_before
+                    if remaining_before is not None and remaining > remaining_before:
+                        restarts += 1
+                        if restarts > self.BACKUP_MAX_RESTARTS:
+                            raise InterruptedError
+                    remaining_before = remaining
+                    time.sleep(self.BACKUP_STEP_DELAY)
+
+                target = sqlite3.connect(partial)
+                try:
+                    source.backup(target, pages=pages, progress=progress)
+                    break
+                except InterruptedError:
+                    continue
+                finally:
+                    target.close()
+        finally:
+            source.close()
+
+        checksum = self._file_checksum(partial)
+        os.replace(partial, path)
+        with open(path + ".sha256", "w") as f:
+            f.write(f"{checksum}  {os.path.basename(path)}\n")
+        return checksum
+
+    def _file_checksum(self, path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _rotate_backups(self, keep):
+        for path in self._backup_paths()[:-keep]:
+            for stale in (path, path + ".sha256"):
+                if os.path.exists(stale):
+                    os.remove(stale)
+
+    async def create_backup(self, keep=8):
+        # Snapshots the live database into backup_dir without stopping the
+        # bot, keeping the `keep` newest snapshots. Returns the snapshot name
+        # and its sha256.
+        os.makedirs(self.backup_dir, exist_ok=True)
+        name = f"{os.path.splitext(os.path.basename(self.db_path))[0]}-{datetime.now():%Y%m%d-%H%M%S-%f}.db"
+        checksum = await asyncio.to_thread(self._write_backup, os.path.join(self.backup_dir, name))
+        await asyncio.to_thread(self._rotate_backups, keep)
+        return name, checksum
+
+    def list_backups(self):
+        return [(os.path.basename(path), os.path.getsize(path)) for path in reversed(self._backup_paths())]
+
+    def _verify_backup(self, name):
+        path = os.path.join(self.backup_dir, os.path.basename(name))
+        if not os.path.exists(path) or not os.path.exists(path + ".sha256"):
+            return None
+        with open(path + ".sha256") as f:
+            expected = f.read().split()[0]
+        return self._file_checksum(path) == expected
+
+    async def verify_backup(self, name):
+        # True if the snapshot matches its checksum, None if it doesn't exist.
+        return await asyncio.to_thread(self._verify_backup, name)
+
+    def _restore_from(self, path):
+        source = sqlite3.connect(self._read_only_uri(path), uri=True)
+        try:
+            source.backup(self.conn)
+        finally:
+            source.close()
+        self._migrate()
+        self._reload_state()
+
+    def _reload_state(self):
+        self.identity_map.clear()
+        self._load_ratings()
+        self._load_faction_stats()
+        self._leaderboards.clear()
+        for GameModeID in self._rating_versions:
+            self._rating_versions[GameModeID] += 1
+        self.perk_version += 1
+
+    async def restore_backup(self, name, keep=8):
+        # Replaces the live database with a verified snapshot. The current
+        # state is snapshotted first so a restore can itself be undone.
+        # Returns the name of that safety snapshot, or None if `name` is
+        # missing or fails its checksum.
+        if not await self.verify_backup(name):
+            return None
+        safety_name, _ = await self.create_backup(keep=keep + 1)
+        await self.run(self._restore_from, os.path.join(self.backup_dir, os.path.basename(name)))
+        return safety_name
@@ -9,3 +9,16 @@ def update_elo(rating_winner, rating_loser, K=32):
     new_rating_loser = rating_loser + K * (0 - expected_loser)
 
     return int(new_rating_winner), int(new_rating_loser)
+
+def rate_match(rating_winner, rating_loser, games=None):
+    # games: the match's game results from the winner's point of view
+    # ("101"), each rated at K=16 as in Lucky Dice; None for a single game.
+    if not games:
+        return update_elo(rating_winner, rating_loser)
+
+    for game in games:
+        if game == "1":
+            rating_winner, rating_loser = update_elo(rating_winner, rating_loser, K=16)
+        else:
+            rating_loser, rating_winner = update_elo(rating_loser, rating_winner, K=16)
+    return rating_winner, rating_loser
@@ -0,0 +1,287 @@
+import asyncio
+import heapq
+from collections import defaultdict
+from datetime import datetime
+
+from utils.rating_pool import RatingPool
+
+
+class MatchQueue:
+    # Authoritative matchmaking queue, one per GameModeID, ordered by enqueue
+    # time. Every change is applied in memory first and written behind to the
+    # queue table in batches; the table is only read back on startup.
+    #
+    # Entries expire `timeout` after they were queued. Deadlines sit in a
+    # min-heap and a single task sleeps until the earliest one; entries that
+    # leave the queue are not searched for in the heap but skipped when their
+    # deadline comes up.
+    #
+    # Opponents are picked by rating: each mode keeps its waiting players in a
+    # RatingPool, and a player is paired with the nearest-rated opponent whose
+    # rating gap fits the search window of whichever of the two has waited
+    # longer. Windows start at BASE_GAP and widen by GAP_PER_MINUTE for every
+    # minute of waiting; a periodic sweep pairs players whose windows have
+    # widened since they queued.
+    FLUSH_DELAY = 1.0
+    BASE_GAP = 150
+    GAP_PER_MINUTE = 50
+    SWEEP_INTERVAL = 15.0
+    DEFAULT_RATING = 1000
+
+    def __init__(self, db, on_change=None, timeout=None, on_expire=None, on_match=None):
+        self.db = db
+        self.on_change = on_change
+        self.timeout = timeout
+        self.on_expire = on_expire
+        self.on_match = on_match
+        self._modes = defaultdict(dict)
+        self._players = defaultdict(set)
+        self._pools = defaultdict(RatingPool)
+        self._quality = defaultdict(lambda: {"matches": 0, "gap_total": 0, "max_gap": 0, "wait_total": 0.0})
+        self._sweep_task = None
+        self._pending = []
+        self._flush_task = None
+        self._deadlines = []
+        self._stale_deadlines = 0
+        self._expiry_task = None
+        self._expiry_wakeup = None
+
+    async def load(self):
+        self._modes.clear()
+        self._players.clear()
+        self._pools.clear()
+        for discord_id, GameModeID, timestamp_queued, _ in sorted(await self.db.get_all_queued_players(),
+                                                                  key=lambda row: row[2] or ""):
+            queued_at = datetime.fromisoformat(timestamp_queued) if timestamp_queued else datetime.now()
+            self._modes[GameModeID][discord_id] = queued_at
+            self._players[discord_id].add(GameModeID)
+            self._pools[GameModeID].add(discord_id, self._rating(discord_id, GameModeID))
+        self._rebuild_deadlines()
+
+    def modes_of(self, discord_id):
+        return sorted(self._players.get(discord_id, ()))
+
+    def contains(self, discord_id, GameModeID):
+        return discord_id in self._modes[GameModeID]
+
+    def players(self, GameModeID):
+        return list(self._modes[GameModeID])
+
+    def count(self, GameModeID):
+        return len(self._modes[GameModeID])
+
+    def entries(self):
+        return [
+            (discord_id, GameModeID, queued_at)
+            for GameModeID, queue in self._modes.items()
+            for discord_id, queued_at in queue.items()
+        ]
+
+    def add(self, discord_id, GameModeID):
+        if discord_id in self._modes[GameModeID]:
+            return False
+        now = datetime.now()
+        self._modes[GameModeID][discord_id] = now
+        self._players[discord_id].add(GameModeID)
+        self._pools[GameModeID].add(discord_id, self._rating(discord_id, GameModeID))
+        self._schedule_expiry(discord_id, GameModeID, now)
+        self._persist("add", discord_id, GameModeID, now)
+        self._changed(GameModeID)
+        return True
+
+    def leave(self, discord_id, GameModeID):
+        # The player left on their own; the row is kept, marked as unqueued.
+        if not self._drop(discord_id, GameModeID):
+            return False
+        self._persist("leave", discord_id, GameModeID, datetime.now())
+        self._changed(GameModeID)
+        return True
+
+    def remove(self, discord_id, GameModeID=None):
+        # Drops the player from one mode, or every mode, and deletes the rows.
+        # Returns the modes they were removed from.
+        modes = [GameModeID] if GameModeID is not None else self.modes_of(discord_id)
+        removed = [mode for mode in modes if self._drop(discord_id, mode)]
+        if removed:
+            self._persist("remove", discord_id, GameModeID, None)
+            for mode in removed:
+                self._changed(mode)
+        return removed
+
+    def pop_match(self, GameModeID, discord_id, now=None):
+        # Pairs the player with the nearest-rated opponent whose gap is
+        # acceptable, taking both out of every queue. Returns the pair or None.
+        queue = self._modes[GameModeID]
+        if discord_id not in queue:
+            return None
+        now = now or datetime.now()
+        waited = (now - queue[discord_id]).total_seconds()
+        # No window is wider than the one of the longest waiting entry, which
+        # comes first since queues are ordered by enqueue time.
+        oldest = (now - next(iter(queue.values()))).total_seconds()
+        for opponent, gap in self._pools[GameModeID].neighbours(discord_id, self.window(max(waited, oldest))):
+            waits = [waited, (now - queue[opponent]).total_seconds()]
+            if gap <= self.window(max(waits)):
+                break
+        else:
+            return None
+
+        quality = self._quality[GameModeID]
+        quality["matches"] += 1
+        quality["gap_total"] += gap
+        quality["max_gap"] = max(quality["max_gap"], gap)
+        quality["wait_total"] += sum(waits)
+
+        pair = discord_id, opponent
+        for player in pair:
+            self.remove(player)
+        return pair
+
+    def window(self, waited_seconds):
+        return self.BASE_GAP + self.GAP_PER_MINUTE * waited_seconds / 60
+
+    def match_quality(self, GameModeID):
+        quality = self._quality[GameModeID]
+        matches = quality["matches"]
+        return {
+            "queued": len(self._modes[GameModeID]),
+            "matches": matches,
+            "avg_gap": round(quality["gap_total"] / matches, 1) if matches else 0,
+            "max_gap": quality["max_gap"],
+            "avg_wait": round(quality["wait_total"] / (2 * matches), 1) if matches else 0,
+        }
+
+    def sweep(self, now=None):
+        # Retries every waiting player, longest waiting first. Returns the
+        # pairs made as (GameModeID, player1, player2).
+        now = now or datetime.now()
+        pairs = []
+        for GameModeID, queue in list(self._modes.items()):
+            for discord_id in list(queue):
+                pair = self.pop_match(GameModeID, discord_id, now)
+                if pair:
+                    pairs.append((GameModeID, *pair))
+        return pairs
+
+    def _rating(self, discord_id, GameModeID):
+        entry = self.db.ratings.get(discord_id, GameModeID)
+        return entry[0] if entry else self.DEFAULT_RATING
+
+    def _drop(self, discord_id, GameModeID):
+        if self._modes[GameModeID].pop(discord_id, None) is None:
+            return False
+        self._pools[GameModeID].remove(discord_id)
+        if self.timeout is not None:
+            self._stale_deadlines += 1
+        modes = self._players.get(discord_id)
+        if modes is not None:
+            modes.discard(GameModeID)
+            if not modes:
+                del self._players[discord_id]
+        return True
+
+    def start(self, ready=None):
+        # Called once the expiry and match listeners are in place; entries
+        # that expired while the bot was offline are removed straight away.
+        # Sweeping waits for `ready`, if given, since the pairs it makes need
+        # a connected bot to open their match threads.
+        loop = asyncio.get_running_loop()
+        if self.timeout is not None and self._expiry_task is None:
+            self._expiry_wakeup = asyncio.Event()
+            self._expiry_task = loop.create_task(self._expire())
+        if self._sweep_task is None:
+            self._sweep_task = loop.create_task(self._sweep_periodically(ready))
+
+    async def _sweep_periodically(self, ready):
+        if ready is not None:
+            await ready()
+        while True:
+            await asyncio.sleep(self.SWEEP_INTERVAL)
+            for GameModeID, player1, player2 in self.sweep():
+                if self.on_match:
+                    self.on_match(GameModeID, player1, player2)
+
+    def _schedule_expiry(self, discord_id, GameModeID, queued_at):
+        if self.timeout is None:
+            return
+        deadline = queued_at + self.timeout
+        heapq.heappush(self._deadlines, (deadline, discord_id, GameModeID))
+        if self._deadlines[0][0] == deadline and self._expiry_wakeup is not None:
+            self._expiry_wakeup.set()
+
+    def _rebuild_deadlines(self):
+        if self.timeout is None:
+            return
+        self._deadlines = [(queued_at + self.timeout, discord_id, GameModeID)
+                           for discord_id, GameModeID, queued_at in self.entries()]
+        heapq.heapify(self._deadlines)
+        self._stale_deadlines = 0
+        if self._expiry_wakeup is not None:
+            self._expiry_wakeup.set()
+
+    async def _expire(self):
+        while True:
+            if self._stale_deadlines > 64 and self._stale_deadlines > len(self._deadlines) // 2:
+                self._rebuild_deadlines()
+            delay = (self._deadlines[0][0] - datetime.now()).total_seconds() if self._deadlines else None
+            if delay is None or delay > 0:
+                self._expiry_wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._expiry_wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            deadline, discord_id, GameModeID = heapq.heappop(self._deadlines)
+            queued_at = self._modes[GameModeID].get(discord_id)
+            if queued_at is None or queued_at + self.timeout != deadline:
+                # Left, matched or queued again since.
+                self._stale_deadlines = max(self._stale_deadlines - 1, 0)
+                continue
+            self.remove(discord_id, GameModeID)
+            self._stale_deadlines -= 1
+            if self.on_expire:
+                self.on_expire(discord_id, GameModeID)
+
+    def _changed(self, GameModeID):
+        if self.on_change:
+            self.on_change(GameModeID)
+
+    def _persist(self, change, discord_id, GameModeID, timestamp):
+        self._pending.append((change, discord_id, GameModeID, timestamp.isoformat() if timestamp else None))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.FLUSH_DELAY)
+        await self.flush()
+
+    async def flush(self):
+        changes, self._pending = self._pending, []
+        if not changes:
+            return
+        try:
+            # Shielded so that cancelling a pending flush never drops a batch
+            # that is already on its way to the database thread.
+            await asyncio.shield(self.db.apply_queue_changes(changes))
+        except Exception as e:
+            print(f"Error persisting {len(changes)} queue changes: {e}")
+            self._pending[:0] = changes
+
+    async def resync(self):
+        # Rewrites the queue table from memory, dropping unflushed changes
+        # since the rewrite already contains them.
+        self._pending = []
+        await self.db.replace_queue(self.entries())
+
+    async def close(self):
+        for task in (self._expiry_task, self._sweep_task):
+            if task:
+                task.cancel()
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
@@ -0,0 +1,125 @@
+# Schema migrations applied on top of the base tables created by
+# Database._create_tables. Each entry bumps PRAGMA user_version by one;
+# never edit a released migration, append a new one instead. An entry is
+# either an SQL script or a function taking the cursor, for data migrations.
+
+from logic import update_elo
+
+LUCKYDICE_GAME_SEQUENCES = ("110", "101", "011", "111")
+
+
+def backfill_luckydice_games(cursor):
+    # Lucky Dice results used to be stored without their games. Finds the game
+    # sequence (from the match winner's point of view) that reproduces the
+    # stored ratings; rows no sequence explains were re-recorded as a single
+    # game by edit_match and keep games NULL.
+    cursor.execute("""
+        SELECT id, elo_before_winner, elo_after_winner, elo_before_loser, elo_after_loser
+        FROM match_history
+        WHERE GameModeID = 4 AND games IS NULL
+    """)
+    updates = []
+    for match_id, before_winner, after_winner, before_loser, after_loser in cursor.fetchall():
+        for games in LUCKYDICE_GAME_SEQUENCES:
+            winner, loser = before_winner, before_loser
+            for game in games:
+                if game == "1":
+                    winner, loser = update_elo(winner, loser, K=16)
+                else:
+                    loser, winner = update_elo(loser, winner, K=16)
+            if (winner, loser) == (after_winner, after_loser):
+                updates.append((games, match_id))
+                break
+    cursor.executemany("UPDATE match_history SET games = ? WHERE id = ?", updates)
+
+
+MIGRATIONS = [
+    # 1: indexes for the hot lookup paths
+    """
+    CREATE INDEX IF NOT EXISTS idx_match_history_player1 ON match_history (player1, GameModeID);
+    CREATE INDEX IF NOT EXISTS idx_match_history_player2 ON match_history (player2, GameModeID);
+    CREATE INDEX IF NOT EXISTS idx_match_history_winner ON match_history (winner);
+    CREATE INDEX IF NOT EXISTS idx_matches_player1 ON matches (player1);
+    CREATE INDEX IF NOT EXISTS idx_matches_player2 ON matches (player2);
+    CREATE INDEX IF NOT EXISTS idx_bets_match ON bets (match_id, resolved);
+    CREATE INDEX IF NOT EXISTS idx_bets_bettor ON bets (bettor_id, match_id);
+    CREATE INDEX IF NOT EXISTS idx_player_ratings_mode_elo ON player_ratings (GameModeID, elo);
+    CREATE INDEX IF NOT EXISTS idx_queue_mode ON queue (GameModeID, is_matched, is_unqueued);
+    CREATE INDEX IF NOT EXISTS idx_user_rewards_user ON user_rewards (user_id, role_id);
+    """,
+    # 2: timestamp indexes used to find rows for the season archives
+    """
+    CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp);
+    CREATE INDEX IF NOT EXISTS idx_match_history_datetime ON match_history (datetime);
+    CREATE INDEX IF NOT EXISTS idx_bets_placed_at ON bets (placed_at);
+    """,
+    # 3: per-game Lucky Dice results and reverted matches, for rating replays
+    """
+    ALTER TABLE match_history ADD COLUMN games TEXT;
+    ALTER TABLE match_history ADD COLUMN reverted BOOLEAN DEFAULT FALSE;
+    """,
+    # 4: game results for Lucky Dice matches recorded before migration 3
+    backfill_luckydice_games,
+    # 5: per-player rating timeline, one row per player per match. seq is the
+    # match_history id, which orders a player's matches.
+    """
+    CREATE TABLE IF NOT EXISTS rating_events (
+        player_id INTEGER NOT NULL,
+        GameModeID INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        opponent_id INTEGER NOT NULL,
+        won BOOLEAN NOT NULL,
+        elo_before INTEGER,
+        elo_after INTEGER,
+        datetime TEXT,
+        PRIMARY KEY (player_id, GameModeID, seq)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_rating_events_player ON rating_events (player_id, seq);
+    CREATE INDEX IF NOT EXISTS idx_rating_events_seq ON rating_events (seq);
+
+    INSERT OR REPLACE INTO rating_events (player_id, GameModeID, seq, opponent_id, won, elo_before, elo_after, datetime)
+    SELECT winner, GameModeID, id, CASE WHEN winner = player1 THEN player2 ELSE player1 END, TRUE,
+           elo_before_winner, elo_after_winner, datetime
+    FROM match_history WHERE reverted = FALSE
+    UNION ALL
+    SELECT CASE WHEN winner = player1 THEN player2 ELSE player1 END, GameModeID, id, winner, FALSE,
+           elo_before_loser, elo_after_loser, datetime
+    FROM match_history WHERE reverted = FALSE;
+    """,
+    # 6: last known Discord names, kept current from gateway events
+    """
+    CREATE TABLE IF NOT EXISTS player_names (
+        discord_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        display_name TEXT NOT NULL,
+        updated_at TEXT
+    );
+    """,
+    # 7: messages the bot keeps editing in place (queue board, leaderboards),
+    # one row per message of a board
+    """
+    CREATE TABLE IF NOT EXISTS board_messages (
+        board TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        PRIMARY KEY (board, position)
+    );
+    """,
+    # 8: board messages keyed by purpose, game mode and channel. Boards that
+    # are not tied to a mode use GameModeID 0.
+    """
+    CREATE TABLE board_messages_new (
+        purpose TEXT NOT NULL,
+        GameModeID INTEGER NOT NULL DEFAULT 0,
+        channel_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        PRIMARY KEY (purpose, GameModeID, channel_id, position)
+    );
+    INSERT INTO board_messages_new (purpose, GameModeID, channel_id, position, message_id)
+    SELECT board, 0, channel_id, position, message_id FROM board_messages;
+    DROP TABLE board_messages;
+    ALTER TABLE board_messages_new RENAME TO board_messages;
+    """,
+]
@@ -0,0 +1,81 @@
+import asyncio
+from collections import namedtuple
+from datetime import datetime
+
+PlayerName = namedtuple("PlayerName", ["name", "display_name"])
+
+
+class NameDirectory:
+    # Last known username and display name per Discord ID, so names can be
+    # rendered without asking Discord. Kept current from gateway events and
+    # written behind to the player_names table, which is read once on startup.
+    FLUSH_DELAY = 5.0
+
+    def __init__(self, db):
+        self.db = db
+        self._names = {}
+        self._pending = {}
+        self._flush_task = None
+
+    async def load(self):
+        self._names = {
+            discord_id: PlayerName(name, display_name)
+            for discord_id, name, display_name in await self.db.get_player_names()
+        }
+
+    def __len__(self):
+        return len(self._names)
+
+    def get(self, discord_id):
+        return self._names.get(discord_id)
+
+    def remember(self, user):
+        # Takes a Member or a User; a member's display name is their server
+        # nickname.
+        entry = PlayerName(user.name, user.display_name)
+        if self._names.get(user.id) == entry:
+            return
+        self._names[user.id] = entry
+        self._pending[user.id] = entry
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    def remember_all(self, users):
+        for user in users:
+            self.remember(user)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.FLUSH_DELAY)
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        now = datetime.now().isoformat()
+        try:
+            await asyncio.shield(self.db.save_player_names([
+                (discord_id, entry.name, entry.display_name, now) for discord_id, entry in pending.items()
+            ]))
+        except Exception as e:
+            print(f"Error saving {len(pending)} player names: {e}")
+            for discord_id, entry in pending.items():
+                self._pending.setdefault(discord_id, entry)
+
+    async def resync(self):
+        # Writes every known name, e.g. after a restore brought back older
+        # rows.
+        self._pending = {}
+        now = datetime.now().isoformat()
+        await self.db.save_player_names([
+            (discord_id, entry.name, entry.display_name, now) for discord_id, entry in self._names.items()
+        ])
+
+    async def close(self):
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
@@ -0,0 +1,197 @@
+import asyncio
+import functools
+import itertools
+import time
+from collections import deque
+
+# Priority classes, most urgent first.
+INTERACTIVE = 0
+MATCH_SETUP = 1
+BOARD = 2
+DM = 3
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def delay(self, now):
+        # Seconds until a token is available; 0 if one is available now.
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class _Job:
+    def __init__(self, priority, route, factory, key):
+        self.priority = priority
+        self.route = route
+        self.factory = factory
+        self.key = key
+        self.futures = [asyncio.get_running_loop().create_future()]
+
+
+class Outbound:
+    # Single scheduler for the bot's own Discord traffic. Calls are queued
+    # per priority class and started most urgent first, subject to a token
+    # bucket per route (a channel, a DM or a guild's roles) and a global one.
+    # Calls on the same route run one at a time in submission order; calls on
+    # different routes run concurrently. INTERACTIVE calls are not held back
+    # by their route's bucket, only counted against it, so a reply is never
+    # queued behind a burst of board edits in its channel. A pending call
+    # submitted with a key is superseded by a later call with the same key;
+    # pending edits of a message are merged, so one edit carries every
+    # changed field.
+    ROUTE_RATE = 1.0
+    ROUTE_BURST = 5
+    GLOBAL_RATE = 40.0
+    GLOBAL_BURST = 40
+    MAX_IN_FLIGHT = 8
+
+    def __init__(self):
+        self._queues = {priority: deque() for priority in (INTERACTIVE, MATCH_SETUP, BOARD, DM)}
+        self._keyed = {}
+        self._buckets = {}
+        self._global = TokenBucket(self.GLOBAL_RATE, self.GLOBAL_BURST)
+        self._busy_routes = set()
+        self._in_flight = 0
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._runner = None
+        self._tasks = set()
+        self.sent = {priority: 0 for priority in self._queues}
+        self.collapsed = 0
+
+    def submit(self, priority, route, factory, key=None):
+        # factory is called without arguments and returns the awaitable that
+        # performs the call. Returns a future for its result.
+        if key is not None and key in self._keyed:
+            job = self._keyed[key]
+            job.factory = factory
+            job.futures.append(asyncio.get_running_loop().create_future())
+            self.collapsed += 1
+            return job.futures[-1]
+
+        job = _Job(priority, route, factory, key)
+        self._queues[priority].append(job)
+        if key is not None:
+            self._keyed[key] = job
+        self._wake()
+        return job.futures[0]
+
+    def send(self, messageable, *args, priority=INTERACTIVE, **kwargs):
+        return self.submit(priority, ("send", messageable.id),
+                           functools.partial(messageable.send, *args, **kwargs))
+
+    def edit(self, message, priority=BOARD, **fields):
+        key = ("edit", message.id)
+        pending = self._keyed.get(key)
+        if pending is not None:
+            fields = {**pending.factory.keywords, **fields}
+        return self.submit(priority, ("send", message.channel.id), functools.partial(message.edit, **fields),
+                           key=key)
+
+    def delete(self, message, priority=BOARD):
+        return self.submit(priority, ("send", message.channel.id), message.delete, key=("delete", message.id))
+
+    def call(self, priority, route, method, *args, **kwargs):
+        return self.submit(priority, route, functools.partial(method, *args, **kwargs))
+
+    def pending(self):
+        return {priority: len(queue) for priority, queue in self._queues.items()}
+
+    def _wake(self):
+        if self._runner is None or self._runner.done():
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+        self._wakeup.set()
+
+    def _bucket(self, route):
+        bucket = self._buckets.get(route)
+        if bucket is None:
+            bucket = self._buckets[route] = TokenBucket(self.ROUTE_RATE, self.ROUTE_BURST)
+        return bucket
+
+    def _next_job(self):
+        # Returns the most urgent job that may start now, or None and how long
+        # to wait before one might (None if nothing is waiting on a bucket).
+        if self._in_flight >= self.MAX_IN_FLIGHT:
+            return None, None
+        now = time.monotonic()
+        wait = self._global.delay(now)
+        if wait:
+            return None, wait
+        blocked = set()
+        for queue in self._queues.values():
+            for job in queue:
+                if job.route in self._busy_routes or job.route in blocked:
+                    continue
+                delay = self._bucket(job.route).delay(now)
+                if delay and job.priority != INTERACTIVE:
+                    blocked.add(job.route)
+                    wait = delay if not wait else min(wait, delay)
+                    continue
+                queue.remove(job)
+                return job, None
+        return None, wait or None
+
+    async def _run(self):
+        while True:
+            job, wait = self._next_job()
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if job.key is not None:
+                del self._keyed[job.key]
+            self._global.take()
+            self._bucket(job.route).take()
+            self._busy_routes.add(job.route)
+            self._in_flight += 1
+            task = asyncio.create_task(self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, job):
+        try:
+            result = await job.factory()
+        except Exception as e:
+            for future in job.futures:
+                if not future.done():
+                    future.set_exception(e)
+        except BaseException:
+            for future in job.futures:
+                future.cancel()
+            raise
+        else:
+            for future in job.futures:
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.sent[job.priority] += 1
+            self._busy_routes.discard(job.route)
+            self._in_flight -= 1
+            self._wakeup.set()
+
+    async def close(self):
+        if self._runner is not None:
+            self._runner.cancel()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for queue in self._queues.values():
+            for job in queue:
+                for future in job.futures:
+                    future.cancel()
+            queue.clear()
+        self._keyed.clear()
@@ -0,0 +1,100 @@
+import numpy as np
+
+from logic import update_elo
+
+# Replays a game mode's match history from scratch. Matches are rated in
+# waves: a wave holds matches that share no player, so a whole wave is rated
+# with a handful of array operations, and every match lands in the wave right
+# after the last match of either of its players.
+
+SINGLE_GAME_K = 32
+LUCKYDICE_GAME_K = 16
+
+# Values this close to an integer may truncate differently from
+# logic.update_elo if NumPy's pow differs in the last bit, so they are
+# recomputed with update_elo itself.
+BOUNDARY_EPSILON = 1e-6
+
+
+def assign_waves(winners, losers, player_count):
+    last_wave = [0] * player_count
+    waves = []
+    for winner, loser in zip(winners.tolist(), losers.tolist()):
+        a, b = last_wave[winner], last_wave[loser]
+        wave = (a if a > b else b) + 1
+        last_wave[winner] = last_wave[loser] = wave
+        waves.append(wave)
+    return np.array(waves, dtype=np.int64)
+
+
+def rate_games(rating_winner, rating_loser, K):
+    expected_winner = 1 / (1 + 10.0 ** ((rating_loser - rating_winner) / 400))
+    expected_loser = 1 / (1 + 10.0 ** ((rating_winner - rating_loser) / 400))
+
+    new_rating_winner = rating_winner + K * (1 - expected_winner)
+    new_rating_loser = rating_loser + K * (0 - expected_loser)
+
+    new_winner = np.trunc(new_rating_winner).astype(np.int64)
+    new_loser = np.trunc(new_rating_loser).astype(np.int64)
+
+    near = (np.abs(new_rating_winner - np.rint(new_rating_winner)) < BOUNDARY_EPSILON) | \
+           (np.abs(new_rating_loser - np.rint(new_rating_loser)) < BOUNDARY_EPSILON)
+    for i in np.flatnonzero(near).tolist():
+        new_winner[i], new_loser[i] = update_elo(int(rating_winner[i]), int(rating_loser[i]), K=int(K[i]))
+
+    return new_winner, new_loser
+
+
+def replay(winners, losers, games, seeds):
+    # winners/losers: player slots per match in chronological order.
+    # games: per match, the game results from the match winner's point of
+    # view ("101" for a 2-1 Lucky Dice win, each game at K=16), or None for a
+    # single game at K=32.
+    # seeds: starting rating per player slot.
+    # Returns elo_before_winner, elo_after_winner, elo_before_loser,
+    # elo_after_loser per match and the final rating per slot.
+    winners = np.asarray(winners, dtype=np.int64)
+    losers = np.asarray(losers, dtype=np.int64)
+    ratings = np.array(seeds, dtype=np.int64)
+    count = len(winners)
+
+    lengths = np.fromiter((len(g) if g else 0 for g in games), dtype=np.int64, count=count)
+    multi = np.flatnonzero(lengths)
+    game_count = np.maximum(lengths, 1)
+    max_games = int(game_count.max(initial=1))
+    won = np.ones((count, max_games), dtype=bool)
+    K = np.where(lengths > 0, LUCKYDICE_GAME_K, SINGLE_GAME_K)
+    if len(multi):
+        outcomes = np.frombuffer("".join(g for g in games if g).encode(), dtype=np.uint8) == ord("1")
+        rows = np.repeat(multi, lengths[multi])
+        starts = np.repeat(np.cumsum(lengths[multi]) - lengths[multi], lengths[multi])
+        won[rows, np.arange(len(rows)) - starts] = outcomes
+
+    elo_before_winner = np.empty(count, dtype=np.int64)
+    elo_after_winner = np.empty(count, dtype=np.int64)
+    elo_before_loser = np.empty(count, dtype=np.int64)
+    elo_after_loser = np.empty(count, dtype=np.int64)
+
+    waves = assign_waves(winners, losers, len(ratings))
+    order = np.argsort(waves, kind="stable")
+    bounds = np.flatnonzero(np.diff(waves[order])) + 1
+
+    for wave in np.split(order, bounds):
+        elo_before_winner[wave] = ratings[winners[wave]]
+        elo_before_loser[wave] = ratings[losers[wave]]
+
+        playing = wave
+        for game in range(max_games):
+            playing = playing[game_count[playing] > game]
+            if not len(playing):
+                break
+            game_won = won[playing, game]
+            game_winner = np.where(game_won, winners[playing], losers[playing])
+            game_loser = np.where(game_won, losers[playing], winners[playing])
+            ratings[game_winner], ratings[game_loser] = rate_games(ratings[game_winner], ratings[game_loser],
+                                                                   K[playing])
+
+        elo_after_winner[wave] = ratings[winners[wave]]
+        elo_after_loser[wave] = ratings[losers[wave]]
+
+    return elo_before_winner, elo_after_winner, elo_before_loser, elo_after_loser, ratings
@@ -9,6 +9,16 @@ FORUM_CHANNEL_ID = int(os.getenv("FORUM_CHANNEL_ID"))
 SERVER_ID = int(os.getenv("SERVER_ID"))
 QUEUE_STATUS_CHANNEL_ID = 1424870061931237406
 
+# Logs, match history and resolved bets older than this are moved into the
+# per-season archive databases.
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 180))
+
+# Number of database snapshots kept in the backups directory.
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", 8))
+
+# Players are taken out of a queue after waiting this long without a match.
+QUEUE_TIMEOUT_MINUTES = int(os.getenv("QUEUE_TIMEOUT_MINUTES", 120))
+
 RULES_MESSAGE_LINKS = {
     "land": "https://discord.com/channels/1338951477934162064/1388566604480118864/1388577715380158627",
     "conquest": "https://discord.com/channels/1338951477934162064/1388566604480118864/1388577787249561620",
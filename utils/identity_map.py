@@ -0,0 +1,59 @@
+import threading
+from collections import OrderedDict
+
+
+class IdentityMap:
+    # Bounded LRU map between Discord user IDs and players.id, resolvable in
+    # both directions. Evicting an entry drops both directions at once.
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._by_discord_id = OrderedDict()
+        self._by_player_id = {}
+        self._lock = threading.Lock()
+
+    def get_player_id(self, discord_id):
+        with self._lock:
+            player_id = self._by_discord_id.get(discord_id)
+            if player_id is None:
+                self.misses += 1
+                return None
+            self._by_discord_id.move_to_end(discord_id)
+            self.hits += 1
+            return player_id
+
+    def get_discord_id(self, player_id):
+        with self._lock:
+            discord_id = self._by_player_id.get(player_id)
+            if discord_id is None:
+                self.misses += 1
+                return None
+            self._by_discord_id.move_to_end(discord_id)
+            self.hits += 1
+            return discord_id
+
+    def add(self, discord_id, player_id):
+        with self._lock:
+            self._by_discord_id[discord_id] = player_id
+            self._by_discord_id.move_to_end(discord_id)
+            self._by_player_id[player_id] = discord_id
+            while len(self._by_discord_id) > self.capacity:
+                _, evicted_player_id = self._by_discord_id.popitem(last=False)
+                self._by_player_id.pop(evicted_player_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._by_discord_id.clear()
+            self._by_player_id.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._by_discord_id),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups * 100, 1) if lookups else 0,
+            }
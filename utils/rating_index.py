@@ -0,0 +1,48 @@
+import threading
+from bisect import bisect_right, insort
+
+
+class RatingIndex:
+    # Per-mode order statistics over player_ratings, keyed by Discord ID.
+    # Each mode keeps a sorted array of ratings next to the per-player rows, so
+    # rank and total are a binary search away instead of two COUNT(*) scans.
+    def __init__(self):
+        self._players = {}
+        self._sorted = {}
+        self._lock = threading.Lock()
+
+    def load(self, rows):
+        with self._lock:
+            self._players.clear()
+            self._sorted.clear()
+            for discord_id, GameModeID, elo, matches, wins in rows:
+                self._players.setdefault(GameModeID, {})[discord_id] = (elo, matches or 0, wins or 0)
+            for GameModeID, players in self._players.items():
+                self._sorted[GameModeID] = sorted(elo for elo, _, _ in players.values())
+
+    def update(self, discord_id, GameModeID, elo, matches, wins):
+        with self._lock:
+            players = self._players.setdefault(GameModeID, {})
+            ratings = self._sorted.setdefault(GameModeID, [])
+            previous = players.get(discord_id)
+            if previous is not None:
+                del ratings[bisect_right(ratings, previous[0]) - 1]
+            players[discord_id] = (elo, matches or 0, wins or 0)
+            insort(ratings, elo)
+
+    def get(self, discord_id, GameModeID):
+        with self._lock:
+            return self._players.get(GameModeID, {}).get(discord_id)
+
+    def rank(self, discord_id, GameModeID):
+        with self._lock:
+            entry = self._players.get(GameModeID, {}).get(discord_id)
+            if entry is None:
+                return None, None
+            ratings = self._sorted[GameModeID]
+            higher_rank_count = len(ratings) - bisect_right(ratings, entry[0])
+            return higher_rank_count + 1, len(ratings)
+
+    def total(self, GameModeID):
+        with self._lock:
+            return len(self._sorted.get(GameModeID, ()))
@@ -0,0 +1,57 @@
+from bisect import bisect_left, insort
+
+
+class RatingPool:
+    # Players waiting in one mode's queue, sorted by the rating they queued
+    # with, so the nearest-rated opponent is a binary search away.
+    def __init__(self):
+        self._entries = []
+        self._ratings = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, discord_id):
+        return discord_id in self._ratings
+
+    def rating(self, discord_id):
+        return self._ratings.get(discord_id)
+
+    def add(self, discord_id, rating):
+        self.remove(discord_id)
+        self._ratings[discord_id] = rating
+        insort(self._entries, (rating, discord_id))
+
+    def remove(self, discord_id):
+        rating = self._ratings.pop(discord_id, None)
+        if rating is None:
+            return False
+        del self._entries[bisect_left(self._entries, (rating, discord_id))]
+        return True
+
+    def clear(self):
+        self._entries.clear()
+        self._ratings.clear()
+
+    def neighbours(self, discord_id, max_gap):
+        # Yields (opponent, rating gap) for every other player at most max_gap
+        # away, nearest first, by walking outward from the player's position.
+        rating = self._ratings.get(discord_id)
+        if rating is None:
+            return
+        index = bisect_left(self._entries, (rating, discord_id))
+        below, above = index - 1, index + 1
+        while True:
+            below_gap = rating - self._entries[below][0] if below >= 0 else None
+            above_gap = self._entries[above][0] - rating if above < len(self._entries) else None
+            if below_gap is not None and (above_gap is None or below_gap <= above_gap):
+                gap, opponent = below_gap, self._entries[below][1]
+                below -= 1
+            elif above_gap is not None:
+                gap, opponent = above_gap, self._entries[above][1]
+                above += 1
+            else:
+                return
+            if gap > max_gap:
+                return
+            yield opponent, gap
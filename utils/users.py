@@ -0,0 +1,47 @@
+import asyncio
+
+import discord
+
+# Upper bound on fetch_user calls in flight for a single resolve_users call.
+FETCH_CONCURRENCY = 8
+
+
+async def resolve_users(bot, discord_ids, guild=None):
+    # Maps every Discord ID to something with name and display_name (a
+    # Member, a User or a NameDirectory entry), or to None if Discord does
+    # not know it. Members, known names and cached users are used as they
+    # are; only the remaining IDs are fetched, once each and concurrently.
+    users = {}
+    missing = []
+    for discord_id in discord_ids:
+        if discord_id is None:
+            continue
+        discord_id = int(discord_id)
+        if discord_id in users:
+            continue
+        user = (guild.get_member(discord_id) if guild else None) or bot.names.get(discord_id) or \
+            bot.get_user(discord_id)
+        users[discord_id] = user
+        if user is None:
+            missing.append(discord_id)
+
+    if missing:
+        semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+        async def fetch(discord_id):
+            async with semaphore:
+                try:
+                    return await bot.fetch_user(discord_id)
+                except discord.NotFound:
+                    return None
+                except discord.HTTPException as e:
+                    print(f"Error fetching user {discord_id}: {e}")
+                    return None
+
+        for discord_id, user in zip(missing, await asyncio.gather(*(fetch(discord_id) for discord_id in missing))):
+            users[discord_id] = user
+            if user is not None:
+                bot.names.remember(user)
+
+    return users
+